@@ -1,9 +1,9 @@
 
 import re
 import os
+import functools
 from typing import Any, Dict, Optional, Union, Iterator, AsyncIterator
 from pydantic import Field, SecretStr
-import openai
 
 def from_env(key: str, default: Any = None) -> Any:
     """Get value from environment variable."""
@@ -18,6 +18,23 @@ def secret_from_env(key: str, default: Any = None) -> Any:
     return SecretStr(value)
 
 
+@functools.lru_cache(maxsize=None)
+def _shared_openai_clients(api_key: Optional[str]):
+    """Build (sync, async) OpenAI clients once per API key over pooled HTTP connections."""
+    import httpx
+    import openai
+
+    limits = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60.0)
+    client_params = {
+        "api_key": api_key,
+        "max_retries": 2,
+    }
+    return (
+        openai.OpenAI(http_client=httpx.Client(limits=limits), **client_params),
+        openai.AsyncOpenAI(http_client=httpx.AsyncClient(limits=limits), **client_params),
+    )
+
+
 class BaseMessage:
 
 
@@ -158,6 +175,15 @@ class Runnable:
         return Runnable(lambda x: other.invoke(self.invoke(x)))
 
 
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+
+@functools.lru_cache(maxsize=256)
+def _split_template(template: str) -> tuple:
+    """Split a template once into [text, key, text, key, ..., text] for single-pass formatting."""
+    return tuple(_PLACEHOLDER_RE.split(template))
+
+
 class ChatPromptTemplate:
     """Minimal chat prompt template implementation."""
     
@@ -168,6 +194,12 @@ class ChatPromptTemplate:
     def from_template(cls, template):
         """Create from template string."""
         return cls([{"role": "user", "content": template}])
+
+    @classmethod
+    def from_messages(cls, messages):
+        """Create from (role, template) pairs, e.g. a static system prefix then the user turn."""
+        roles = {"human": "user", "ai": "assistant"}
+        return cls([{"role": roles.get(role, role), "content": template} for role, template in messages])
     
     def __or__(self, other):
         """Pipe operator for chaining."""
@@ -178,10 +210,13 @@ class ChatPromptTemplate:
         formatted = []
         for message in self.messages:
             if isinstance(message, dict):
-                content = message.get("content", "")
-                for key, value in kwargs.items():
-                    content = content.replace(f"{{{key}}}", str(value))
-                formatted.append({**message, "content": content})
+                parts = _split_template(message.get("content", ""))
+                pieces = list(parts)
+                # Odd slots are placeholder names; unknown ones are left as written
+                for i in range(1, len(parts), 2):
+                    key = parts[i]
+                    pieces[i] = str(kwargs[key]) if key in kwargs else f"{{{key}}}"
+                formatted.append({**message, "content": "".join(pieces)})
             else:
                 formatted.append(message)
         return formatted
@@ -331,8 +366,9 @@ class BaseLanguageModel:
         return list(range(len(text)))
 
     def get_num_tokens(self, text: str) -> int:
-        """Get number of tokens in text."""
-        return len(self.get_token_ids(text))
+        """Get number of tokens in text (character count, matching get_token_ids)."""
+        # Counted directly so sizing a large prompt doesn't build a throwaway id list
+        return len(text)
 
     def get_num_tokens_from_messages(self, messages, tools=None) -> int:
         """Get number of tokens from messages."""
@@ -379,8 +415,9 @@ class BaseChatModel:
         return result.generations[0].message
 
     def bind(self, **kwargs):
-        """Bind additional parameters to the model."""
-        return self
+        """Bind additional parameters (stop, response_format, ...) to every call."""
+        bound = kwargs
+        return Runnable(lambda x, **call_kwargs: self.invoke(x, **{**bound, **call_kwargs}))
     
     def __or__(self, other):
         """Pipe operator for chaining."""
@@ -430,25 +467,19 @@ class BaseChatOpenAI(BaseChatModel):
         self.openai_api_base = None
         self.request_timeout = None
         
-        self._setup_clients()
+        # Clients (and the openai package) are set up on the first request
+        self._clients_ready = False
 
     def _setup_clients(self):
         """Setup OpenAI clients."""
         # Get API key from environment
         api_key = os.getenv("OPENAI_API_KEY")
-        
-        # Initialize OpenAI client with minimal parameters
-        client_params = {
-            "api_key": api_key,
-        }
 
-        # Initialize OpenAI client
-        self.root_client = openai.OpenAI(**client_params)
+        # Instances share one client pair so every model reuses the same keep-alive pool
+        self.root_client, self.root_async_client = _shared_openai_clients(api_key)
         self.client = self.root_client.chat.completions
-        
-        # Initialize async client
-        self.root_async_client = openai.AsyncOpenAI(**client_params)
         self.async_client = self.root_async_client.chat.completions
+        self._clients_ready = True
 
     @property
     def _default_params(self) -> dict[str, Any]:
@@ -479,6 +510,8 @@ class BaseChatOpenAI(BaseChatModel):
             return {"role": "assistant", "content": message.content}
         elif hasattr(message, 'role') and hasattr(message, 'content'):
             return {"role": message.role, "content": message.content}
+        elif message.type in ("system", "user", "assistant"):
+            return {"role": message.type, "content": str(message.content)}
         else:
             # Default to user role
             return {"role": "user", "content": str(message.content)}
@@ -486,6 +519,8 @@ class BaseChatOpenAI(BaseChatModel):
     def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Optional[Any] = None, **kwargs: Any) -> ChatResult:
         """Generate response from OpenAI."""
         payload = self._get_request_payload(messages, stop=stop, **kwargs)
+        if not self._clients_ready:
+            self._setup_clients()
         try:
             response = self.client.create(**payload)
         except Exception as e:
@@ -1,12 +1,24 @@
 import os
 import json
+import atexit
+import collections
+import hashlib
+import functools
+import itertools
+import logging
+import math
+import queue
+import re
+import secrets
 import sqlite3
-import uuid
-import requests
+import sys
+import threading
+import time
+import orjson
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, date
 from decimal import Decimal
 from flask import Flask, request, jsonify
-from flask_cors import CORS
 
 # Load environment variables from .env file if it exists
 
@@ -18,6 +30,8 @@ load_dotenv()
 from ChatOpenAI import ChatOpenAI, ChatPromptTemplate, StrOutputParser, RunnablePassthrough
 # from sql_database import SQLDatabase  # Commented out - using API instead
 
+logger = logging.getLogger(__name__)
+
 # API configuration for NoQL database queries
 API_BASE_URL = "https://api.zigment.ai"
 API_HEADERS = {
@@ -30,6 +44,28 @@ API_HEADERS = {
     "x-org-id": "6617aafc195dea3f1dbdd894",
     "zigment-x-api-key": os.environ.get("ZIGMENT_API_KEY")
 }
+# Max NoQL calls in flight per fan-out (table samples, counts, exploration probes)
+NOQL_CONCURRENCY = max(1, int(os.getenv("NOQL_CONCURRENCY", "8")))
+
+@functools.lru_cache(maxsize=None)
+def _http_session():
+    """Shared HTTP session so NoQL calls reuse pooled keep-alive connections.
+
+    Built on first use; workers that only serve conversation endpoints never import requests.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    session.headers.update(API_HEADERS)
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        # Room for a full fan-out plus chart builds and request threads calling directly
+        pool_maxsize=NOQL_CONCURRENCY + 8,
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504)),
+    ))
+    return session
 
 # NoQL Direct Prompt for complex query generation
 NOQL_DIRECT_PROMPT = """
@@ -596,6 +632,7 @@ A: SELECT
 - For user activity: JOIN events ON events.user_id = users._id
 - For organization data: JOIN contacts ON contacts.company = organizations.name
 - For chat data: JOIN chathistories ON chathistories.contact_id = contacts._id
+- LEFT JOIN + LIMIT with no ORDER BY on the joined table: limit the left side first, e.g. `FROM (SELECT _id, full_name FROM contacts LIMIT 20) c LEFT JOIN chathistories ch ON ch.contact_id = c._id`
 
 # USER QUESTION:
 {question}
@@ -616,13 +653,28 @@ else:
         "http://localhost:3001",
         "http://127.0.0.1:3001",
     ]
-CORS(
-    app,
-    resources={r"/*": {"origins": _origins}},
-    supports_credentials=True,
-    methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization", "Accept", "Origin"],
-)
+_ALLOWED_ORIGINS = frozenset(_origins)
+_CORS_ALLOW_ALL = "*" in _ALLOWED_ORIGINS
+_CORS_METHODS = "GET, POST, PUT, DELETE, OPTIONS"
+_CORS_HEADERS = "Content-Type, Authorization, Accept, Origin"
+
+@app.before_request
+def _cors_preflight():
+    """Answer CORS preflight requests directly; headers are added in _cors_headers."""
+    if request.method == "OPTIONS" and "Access-Control-Request-Method" in request.headers:
+        return app.response_class(status=204)
+
+@app.after_request
+def _cors_headers(response):
+    origin = request.headers.get("Origin")
+    if origin and (_CORS_ALLOW_ALL or origin in _ALLOWED_ORIGINS):
+        response.headers["Access-Control-Allow-Origin"] = origin
+        response.headers["Access-Control-Allow-Credentials"] = "true"
+        if request.method == "OPTIONS":
+            response.headers["Access-Control-Allow-Methods"] = _CORS_METHODS
+            response.headers["Access-Control-Allow-Headers"] = _CORS_HEADERS
+    response.vary.add("Origin")
+    return response
 
 # Initialize OpenAI API key
 api_key = os.getenv("OPENAI_API_KEY")
@@ -632,27 +684,78 @@ if not api_key:
     exit(1)
 os.environ["OPENAI_API_KEY"] = api_key
 
-# Database tracking (kept for compatibility, but not used for queries)
-databases = {}
+# Database tracking (kept for compatibility, but not used for queries).
+# Names come straight from request parameters, so keep only the most recently used ones.
+_DATABASES_MAX = 64
+databases = collections.OrderedDict()
+_databases_lock = threading.Lock()
 
 # Simplified registration - just tracks database names
 def register_database(name: str, uri: str = None):
     """Register a database by name (API-based, no actual connection needed)."""
-    databases[name] = {"name": name, "api_based": True}
-    return databases[name]
+    entry = {"name": name, "api_based": True}
+    with _databases_lock:
+        databases[name] = entry
+        databases.move_to_end(name)
+        while len(databases) > _DATABASES_MAX:
+            databases.popitem(last=False)
+    return entry
 
 # ===== JSON Serialization Helpers =====
+@functools.singledispatch
+def _json_default(obj):
+    """orjson fallback for types it can't encode natively; unknown types become str(obj)"""
+    return str(obj)
+
+@_json_default.register
+def _(obj: Decimal):
+    return float(obj)
+
+@_json_default.register
+def _(obj: date):  # also covers datetime
+    return obj.isoformat()
+
+@_json_default.register
+def _(obj: bytes):
+    return obj.decode("utf-8", errors="replace")
+
+def _json_dumps(obj) -> str:
+    """Compact orjson encoding returned as str (for SQLite text columns and prompts)"""
+    return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
 def safe_json_dumps(obj, **kwargs):
-    """JSON dumps with default handler for non-serializable objects (Decimal, datetime, etc.)"""
-    def default_handler(obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        if isinstance(obj, (date, datetime)):
-            return obj.isoformat()
-        if hasattr(obj, '__dict__'):
-            return obj.__dict__
-        return str(obj)
-    return json.dumps(obj, default=default_handler, **kwargs)
+    """JSON dumps with default handler for non-serializable objects (Decimal, datetime, etc.)
+
+    Output is always UTF-8 (equivalent to ensure_ascii=False); `indent` selects 2-space indentation.
+    """
+    option = orjson.OPT_NON_STR_KEYS
+    if kwargs.get("indent"):
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=_json_default, option=option).decode()
+
+def _json_head(obj, limit: int) -> str:
+    """Same as _json_dumps(obj)[:limit], but stops encoding top-level entries once `limit` is reached."""
+    if isinstance(obj, dict) and all(isinstance(k, str) for k in obj):
+        items = (f"{_json_dumps(k)}:{_json_dumps(v)}" for k, v in obj.items())
+        opener, closer = "{", "}"
+    elif isinstance(obj, (list, tuple)):
+        items = map(_json_dumps, obj)
+        opener, closer = "[", "]"
+    else:
+        return _json_dumps(obj)[:limit]
+    parts = [opener]
+    size = 1
+    for i, item in enumerate(items):
+        if i:
+            parts.append(",")
+            size += 1
+        parts.append(item)
+        size += len(item)
+        if size >= limit:
+            break
+    else:
+        parts.append(closer)
+    return "".join(parts)[:limit]
 
 
 # ===== NoQL API Helper Functions =====
@@ -781,8 +884,66 @@ _SCHEMA_DICT = {
         ]
     }
 
-# Convert to JSON string once at module load (used directly throughout the code)
-_SCHEMA_JSON = json.dumps(_SCHEMA_DICT, indent=2)
+# Convert to JSON string once at module load (used directly throughout the code). Compact:
+# the string goes into every prompt, and indentation nearly doubles its size in tokens
+_SCHEMA_JSON = _json_dumps(_SCHEMA_DICT)
+# Content fingerprint of the schema; prompt caches key on it so a schema change invalidates them
+_SCHEMA_FINGERPRINT = hashlib.blake2b(_SCHEMA_JSON.encode(), digest_size=16).hexdigest()
+# Lowercase, underscore-free collection names as the NoQL API expects them, in schema order
+_COLLECTION_QUERY_NAMES = tuple(
+    c.get("name", "").lower().replace("_", "") for c in _SCHEMA_DICT.get("collections", [])
+)
+
+def _build_time_filter_guidance(schema: dict) -> str:
+    """Per-column date-filter rules derived from the schema's time fields.
+
+    Epoch-seconds columns compare against numbers and native date columns against date
+    literals; either way the column stays bare in WHERE so the filter can use an index.
+    """
+    epoch_cols, date_cols = [], []
+    for collection in schema.get("collections", []):
+        table = collection.get("name", "").lower().replace("_", "")
+        for field in collection.get("fields", []):
+            # Storage decides first: epoch fields may be typed NUMBER (events.timestamp) or DATETIME
+            if field.get("storage") == "unix_epoch_seconds":
+                epoch_cols.append(f"{table}.{field['name']}")
+            elif field.get("type") == "DATETIME":
+                date_cols.append(f"{table}.{field['name']}")
+    return "\n".join((
+        "# TIME COLUMN TYPES (match the literal to the column's storage):",
+        f"- Unix epoch seconds, compare with numbers: {', '.join(epoch_cols) or '(none)'}",
+        f"- Native dates, compare with date literals: {', '.join(date_cols) or '(none)'}",
+        "- Keep the filtered column bare in WHERE and convert the literal instead, so the filter can use an index:",
+        "  ✅ `WHERE created_at_timestamp >= 1704067200 AND created_at_timestamp < 1719792000`",
+        "  ✅ `WHERE created_at >= TO_DATE('2024-01-01') AND created_at < TO_DATE('2024-07-01')`",
+        "  ❌ `WHERE TO_DATE(created_at_timestamp * 1000) >= TO_DATE('2024-01-01')` (converts every row)",
+        "  ❌ `WHERE created_at >= 1704067200` (native date compared with a number)",
+    ))
+
+_TIME_FILTER_GUIDANCE = _build_time_filter_guidance(_SCHEMA_DICT)
+# Schema text for query-writing prompts: the schema plus the date-filter rules derived from it
+_SCHEMA_PROMPT_TEXT = f"{_SCHEMA_JSON}\n\n{_TIME_FILTER_GUIDANCE}"
+
+@functools.lru_cache(maxsize=32)
+def _render_noql_prompt(database_name: str, schema_fingerprint: str) -> str:
+    """NOQL_DIRECT_PROMPT with the schema already substituted; {question} is left open."""
+    return NOQL_DIRECT_PROMPT.replace("{schema}", _SCHEMA_PROMPT_TEXT)
+
+def get_noql_prompt_template(database_name: str) -> str:
+    """Schema-filled NoQL prompt for a database, memoized per (database, schema fingerprint)."""
+    return _render_noql_prompt(database_name, _SCHEMA_FINGERPRINT)
+
+_NOQL_QUESTION_SLOT = "# USER QUESTION:\n{question}\n\n"
+
+@functools.lru_cache(maxsize=32)
+def _noql_system_message(database_name: str, schema_fingerprint: str) -> dict:
+    """Schema-filled NoQL rules without the question, sent as an identical system message every call.
+
+    Keeping the multi-KB rulebook byte-for-byte stable at the front of the request lets the
+    provider's prompt cache reuse it; only the short user message changes per question.
+    """
+    rules = _render_noql_prompt(database_name, schema_fingerprint).replace(_NOQL_QUESTION_SLOT, "")
+    return {"role": "system", "content": rules}
 
 def get_hardcoded_schema() -> dict:
     """Return hardcoded schema for the application."""
@@ -800,23 +961,50 @@ def execute_noql_query(sql_query: str) -> dict:
         "type": "table"
     }
     
+    session = _http_session()
+    from requests import RequestException
+    
     try:
-        response = requests.post(url, headers=API_HEADERS, json=payload, timeout=30)
+        response = session.post(url, json=payload, timeout=30)
         response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        # Parse the raw body directly; skips requests' charset detection and stdlib json
+        return orjson.loads(response.content)
+    except RequestException as e:
         print(f"Error executing query: {e}")
         if hasattr(e, 'response') and hasattr(e.response, 'text'):
             print(f"Response: {e.response.text}")
         raise
 
+# Shared pool for fanning out independent NoQL calls over the pooled HTTP session
+_NOQL_POOL = ThreadPoolExecutor(max_workers=NOQL_CONCURRENCY, thread_name_prefix="noql")
+
+def execute_noql_queries_parallel(queries: list[str]) -> list:
+    """Execute independent NoQL queries concurrently.
+
+    Results are returned in input order; a failed query yields its exception instead of a dict.
+    """
+    futures = [_NOQL_POOL.submit(execute_noql_query, q) for q in queries]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    return results
+
 # ===== Conversations (SQLite) =====
 SQLITE_PATH = os.getenv("CHAT_SQLITE_PATH", os.path.join(os.path.dirname(__file__), "chat_history.sqlite3"))
+# Bump when _ensure_sqlite gains new DDL; stored in PRAGMA user_version
+SQLITE_SCHEMA_VERSION = 4
 
 def _ensure_sqlite():
     try:
         conn = sqlite3.connect(SQLITE_PATH)
         cur = conn.cursor()
+        # Skip DDL and column checks when this file is already migrated
+        cur.execute("PRAGMA user_version")
+        if cur.fetchone()[0] >= SQLITE_SCHEMA_VERSION:
+            return
         cur.execute(
             """
             CREATE TABLE IF NOT EXISTS conversation (
@@ -878,6 +1066,27 @@ def _ensure_sqlite():
         except Exception as migration_error:
             print(f"Migration warning (non-critical): {migration_error}")
         
+        # Persisted collection counts; expiry is an indexed unix timestamp so lookups and
+        # purges filter in SQL instead of parsing dates in Python
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_counts (
+                database_name TEXT PRIMARY KEY,
+                counts_json TEXT NOT NULL,
+                expires_at INTEGER NOT NULL
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_schema_counts_expires ON schema_counts(expires_at)")
+        
+        # Indexes for the per-conversation lookups (history, facts, summaries, counts)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_message_conversation ON message(conversation_id, created_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_summary_conversation ON summary(conversation_id, created_at)")
+        
+        # WAL lets the background message writer commit without blocking readers
+        cur.execute("PRAGMA journal_mode=WAL")
+        
+        cur.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
         conn.commit()
         print("SQLite database schema updated with database_name columns")
     finally:
@@ -886,11 +1095,113 @@ def _ensure_sqlite():
         except Exception:
             pass
 
+class _TTLCache:
+    """Small thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    Keys are tuples; the first element is the invalidation domain (e.g. a conversation id).
+    """
+    _MISS = object()
+
+    def __init__(self, ttl: float, maxsize: int = 256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return self._MISS
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                return self._MISS
+            self._data[key] = item  # re-insert as most recently used
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            while len(self._data) >= self.maxsize:
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def get_or_fetch(self, key, fetch, should_cache=lambda value: True):
+        """Return the cached value or call `fetch()`; concurrent misses on a key share one call."""
+        value = self.get(key)
+        if value is not self._MISS:
+            return value
+
+        with self._inflight_lock:
+            value = self.get(key)
+            if value is not self._MISS:
+                return value
+            future = self._inflight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            value = fetch()
+            if should_cache(value):
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def invalidate_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == prefix]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# Short-lived read caches for chat history lookups; writers invalidate them
+_facts_cache = _TTLCache(ttl=5.0)
+_conversations_cache = _TTLCache(ttl=5.0, maxsize=8)
+
+# Conversations with at least one stored assistant fact; lets get_past_facts skip SQLite
+# for conversations that have none. Loaded from SQLite once, then kept current by add_message.
+_conversations_with_facts: set[str] | None = None
+_conversations_with_facts_lock = threading.Lock()
+
+def _conversation_has_facts(conversation_id: str) -> bool:
+    global _conversations_with_facts
+    with _conversations_with_facts_lock:
+        if _conversations_with_facts is None:
+            with sqlite3.connect(SQLITE_PATH) as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT DISTINCT conversation_id FROM message WHERE role='assistant' AND facts IS NOT NULL AND facts != ''")
+                _conversations_with_facts = {row[0] for row in cur.fetchall()}
+        return conversation_id in _conversations_with_facts
+
+def _mark_conversation_facts(conversation_id: str, has_facts: bool):
+    with _conversations_with_facts_lock:
+        if _conversations_with_facts is None:
+            return  # not loaded yet; the first lookup reads SQLite
+        if has_facts:
+            _conversations_with_facts.add(conversation_id)
+        else:
+            _conversations_with_facts.discard(conversation_id)
+
 def _now_str():
     return datetime.utcnow().isoformat()
 
 def _gen_id(prefix: str) -> str:
-    return f"{prefix}_{uuid.uuid4().hex[:12]}"
+    return f"{prefix}_{secrets.token_hex(6)}"
 
 _ensure_sqlite()
 
@@ -904,68 +1215,227 @@ def create_conversation(title: str | None = None, database_name: str | None = No
             (conv_id, title or "New conversation", database_name, ts, ts)
         )
         conn.commit()
+    _conversations_cache.clear()
     return conv_id
 
 def list_conversations(limit: int = 100):
+    _flush_message_writes()
+    cached = _conversations_cache.get((limit,))
+    if cached is not _TTLCache._MISS:
+        return cached
     with sqlite3.connect(SQLITE_PATH) as conn:
         conn.row_factory = sqlite3.Row
         cur = conn.cursor()
         cur.execute("SELECT id, title, database_name, created_at, updated_at FROM conversation ORDER BY updated_at DESC LIMIT ?", (limit,))
-        return [dict(row) for row in cur.fetchall()]
-
-def add_message(conversation_id: str, role: str, content_markdown: str, charts: list | None = None, sql_meta: dict | None = None, title_hint: str | None = None, database_name: str | None = None, facts: str | None = None):
-    msg_id = _gen_id("msg")
-    ts = _now_str()
+        items = [dict(row) for row in cur.fetchall()]
+    _conversations_cache.set((limit,), items)
+    return items
+
+# ===== Background message writer =====
+# add_message only enqueues; one thread commits queued messages in batched transactions.
+# Readers call _flush_message_writes(conversation_id) first so they see that conversation's
+# earlier writes; they wait only for messages queued before the call, never for later traffic.
+_MESSAGE_BATCH_SIZE = 64
+_MESSAGE_BATCH_WAIT = 0.05  # seconds to keep collecting after the first queued message
+_MESSAGE_WRITE_ATTEMPTS = 3
+_message_queue: queue.Queue = queue.Queue()
+
+# Messages get increasing sequence numbers in queue order; the writer advances
+# _written_seq past each batch (committed or given up on) and wakes waiting readers
+_write_cond = threading.Condition()
+_enqueued_seq = 0
+_written_seq = 0
+# Latest queued sequence number per conversation with messages still pending
+_pending_seq_by_conversation: dict[str, int] = {}
+
+def _write_message_batch(batch: list[dict]):
     with sqlite3.connect(SQLITE_PATH) as conn:
         cur = conn.cursor()
-        cur.execute(
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("BEGIN IMMEDIATE")
+        cur.executemany(
             "INSERT INTO message (id, conversation_id, role, content_markdown, charts_json, sql_meta_json, database_name, facts, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (msg_id, conversation_id, role, content_markdown or "", json.dumps(charts or []), json.dumps(sql_meta or {}), database_name, facts, ts)
+            [m["row"] for m in batch],
         )
         # Update title on first user message if empty
-        if role == "user" and title_hint:
-            cur.execute("UPDATE conversation SET title=? WHERE id=? AND (title IS NULL OR title='New conversation')", (title_hint[:80], conversation_id))
-        # Update conversation updated_at and database_name
-        cur.execute("UPDATE conversation SET updated_at=?, database_name=? WHERE id=?", (ts, database_name, conversation_id))
+        cur.executemany(
+            "UPDATE conversation SET title=? WHERE id=? AND (title IS NULL OR title='New conversation')",
+            [(m["title_hint"][:80], m["conversation_id"]) for m in batch if m["role"] == "user" and m["title_hint"]],
+        )
+        # Update conversation updated_at and database_name once per conversation,
+        # reusing the timestamp of its latest queued message
+        latest = {m["conversation_id"]: (m["ts"], m["database_name"]) for m in batch}
+        cur.executemany(
+            "UPDATE conversation SET updated_at=?, database_name=? WHERE id=?",
+            [(ts, database_name, conversation_id) for conversation_id, (ts, database_name) in latest.items()],
+        )
         conn.commit()
+    for conversation_id in latest:
+        _facts_cache.invalidate_prefix(conversation_id)
+    _conversations_cache.clear()
+
+def _write_messages_reliably(batch: list[dict]) -> list[dict]:
+    """Commit a batch, retrying transient failures; returns the messages that were stored.
+
+    If the batch keeps failing, messages are written one at a time so a single bad row
+    cannot take the rest of the batch (often other conversations' messages) down with it.
+    """
+    for attempt in range(1, _MESSAGE_WRITE_ATTEMPTS + 1):
+        try:
+            _write_message_batch(batch)
+            return batch
+        except Exception:
+            if attempt == _MESSAGE_WRITE_ATTEMPTS:
+                logger.exception("Failed to write %d queued message(s) after %d attempts", len(batch), attempt)
+            else:
+                logger.warning("Writing %d queued message(s) failed (attempt %d), retrying", len(batch), attempt)
+                time.sleep(0.1 * attempt)
+    if len(batch) == 1:
+        return []
+    written = []
+    for message in batch:
+        try:
+            _write_message_batch([message])
+            written.append(message)
+        except Exception:
+            logger.exception(
+                "Dropping %s message %s for conversation %s", message["role"], message["row"][0], message["conversation_id"]
+            )
+    return written
+
+def _message_writer_loop():
+    global _written_seq
+    while True:
+        batch = [_message_queue.get()]
+        deadline = time.monotonic() + _MESSAGE_BATCH_WAIT
+        while len(batch) < _MESSAGE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_message_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            # Facts are only marked once their message is actually stored
+            for message in _write_messages_reliably(batch):
+                if message["has_facts"]:
+                    _mark_conversation_facts(message["conversation_id"], True)
+        except Exception:
+            logger.exception("Message writer failed on a batch of %d message(s)", len(batch))
+        finally:
+            with _write_cond:
+                _written_seq = batch[-1]["seq"]
+                for message in batch:
+                    if _pending_seq_by_conversation.get(message["conversation_id"]) == message["seq"]:
+                        del _pending_seq_by_conversation[message["conversation_id"]]
+                _write_cond.notify_all()
+            for _ in batch:
+                _message_queue.task_done()
+
+def _flush_message_writes(conversation_id: str | None = None):
+    """Block until messages queued before this call have been written.
+
+    With a conversation_id, only that conversation's queued messages are waited for.
+    """
+    with _write_cond:
+        if conversation_id is None:
+            target = _enqueued_seq
+        else:
+            target = _pending_seq_by_conversation.get(conversation_id, 0)
+        _write_cond.wait_for(lambda: _written_seq >= target)
+
+threading.Thread(target=_message_writer_loop, name="message-writer", daemon=True).start()
+atexit.register(_flush_message_writes)
+
+def add_message(conversation_id: str, role: str, content_markdown: str, charts: list | None = None, sql_meta: dict | None = None, title_hint: str | None = None, database_name: str | None = None, facts: str | None = None):
+    global _enqueued_seq
+    msg_id = _gen_id("msg")
+    ts = _now_str()
+    message = {
+        "row": (msg_id, conversation_id, role, content_markdown or "", _json_dumps(charts or []), _json_dumps(sql_meta or {}), database_name, facts, ts),
+        "conversation_id": conversation_id,
+        "role": role,
+        "title_hint": title_hint,
+        "database_name": database_name,
+        "has_facts": role == "assistant" and bool(facts),
+        "ts": ts,
+    }
+    # Numbered and queued under the lock so queue order matches sequence order
+    with _write_cond:
+        _enqueued_seq += 1
+        message["seq"] = _enqueued_seq
+        _pending_seq_by_conversation[conversation_id] = _enqueued_seq
+        _message_queue.put(message)
     return msg_id
 
+# Stored values that decode to an empty container; skip the JSON parse for these
+_EMPTY_JSON_VALUES = frozenset(("", "[]", "{}"))
+
+def _load_json_column(raw, empty_factory):
+    if raw is None or raw in _EMPTY_JSON_VALUES:
+        return empty_factory()
+    return orjson.loads(raw)
+
 def get_history(conversation_id: str):
+    _flush_message_writes(conversation_id)
+    messages = []
     with sqlite3.connect(SQLITE_PATH) as conn:
         conn.row_factory = sqlite3.Row
         cur = conn.cursor()
         cur.execute("SELECT id, role, content_markdown, charts_json, sql_meta_json, database_name, facts, created_at FROM message WHERE conversation_id=? ORDER BY created_at ASC", (conversation_id,))
-        rows = cur.fetchall()
-        return [
-            {
-                "id": r["id"],
-                "role": r["role"],
-                "content_markdown": r["content_markdown"],
-                "charts": json.loads(r["charts_json"]) if r["charts_json"] else [],
-                "sql_meta": json.loads(r["sql_meta_json"]) if r["sql_meta_json"] else {},
-                "database_name": r["database_name"],
-                "facts": r["facts"],
-                "created_at": r["created_at"],
-            }
-            for r in rows
-        ]
+        # Build messages in chunks instead of holding every raw row alongside the result
+        while True:
+            rows = cur.fetchmany(256)
+            if not rows:
+                break
+            for r in rows:
+                messages.append({
+                    "id": r["id"],
+                    "role": r["role"],
+                    "content_markdown": r["content_markdown"],
+                    "charts": _load_json_column(r["charts_json"], list),
+                    "sql_meta": _load_json_column(r["sql_meta_json"], dict),
+                    "database_name": r["database_name"],
+                    "facts": r["facts"],
+                    "created_at": r["created_at"],
+                })
+    return messages
 
 def delete_conversation(conversation_id: str):
+    _flush_message_writes(conversation_id)
     with sqlite3.connect(SQLITE_PATH) as conn:
         cur = conn.cursor()
+        # One write transaction for all three deletes
+        cur.execute("BEGIN IMMEDIATE")
         cur.execute("DELETE FROM message WHERE conversation_id=?", (conversation_id,))
         cur.execute("DELETE FROM summary WHERE conversation_id=?", (conversation_id,))
         cur.execute("DELETE FROM conversation WHERE id=?", (conversation_id,))
         conn.commit()
+    _mark_conversation_facts(conversation_id, False)
+    _facts_cache.invalidate_prefix(conversation_id)
+    _conversations_cache.clear()
 
 def get_message_count(conversation_id: str) -> int:
+    _flush_message_writes(conversation_id)
     with sqlite3.connect(SQLITE_PATH) as conn:
         cur = conn.cursor()
         cur.execute("SELECT COUNT(*) FROM message WHERE conversation_id=?", (conversation_id,))
         row = cur.fetchone()
         return int(row[0] if row and row[0] is not None else 0)
 
+def message_count_at_least(conversation_id: str, k: int) -> bool:
+    """True when the conversation has at least `k` messages; stops reading after the k-th row."""
+    if k <= 0:
+        return True
+    _flush_message_writes(conversation_id)
+    with sqlite3.connect(SQLITE_PATH) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM message WHERE conversation_id=? LIMIT 1 OFFSET ?", (conversation_id, k - 1))
+        return cur.fetchone() is not None
+
 def get_oldest_messages(conversation_id: str, limit: int = 10):
+    _flush_message_writes(conversation_id)
     with sqlite3.connect(SQLITE_PATH) as conn:
         conn.row_factory = sqlite3.Row
         cur = conn.cursor()
@@ -978,11 +1448,17 @@ def get_oldest_messages(conversation_id: str, limit: int = 10):
 def delete_messages_by_ids(conversation_id: str, ids: list[str]):
     if not ids:
         return
+    _flush_message_writes(conversation_id)
     with sqlite3.connect(SQLITE_PATH) as conn:
         cur = conn.cursor()
-        qmarks = ",".join(["?"] * len(ids))
-        cur.execute(f"DELETE FROM message WHERE conversation_id=? AND id IN ({qmarks})", (conversation_id, *ids))
+        # Fixed statement text so SQLite reuses the prepared statement for every id
+        cur.execute("BEGIN IMMEDIATE")
+        cur.executemany(
+            "DELETE FROM message WHERE conversation_id=? AND id=?",
+            [(conversation_id, mid) for mid in ids],
+        )
         conn.commit()
+    _facts_cache.invalidate_prefix(conversation_id)
 
 def save_summary(conversation_id: str, content: str) -> str:
     sid = _gen_id("sum")
@@ -1017,35 +1493,43 @@ def get_past_facts(database_name: str, limit: int = 10, conversation_id: str | N
     if not database_name:
         return ""
     
+    # No conversation_id = new conversation, return empty facts
+    if not conversation_id:
+        return ""
+    
+    # Facts are marked once their message is written, so flush this conversation first
+    _flush_message_writes(conversation_id)
+    if not _conversation_has_facts(conversation_id):
+        return ""
+    
+    cache_key = (conversation_id, database_name, limit)
+    cached = _facts_cache.get(cache_key)
+    if cached is not _TTLCache._MISS:
+        return cached
+    
     try:
         with sqlite3.connect(SQLITE_PATH) as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             
-            # If conversation_id provided, only get facts from THIS conversation
-            if conversation_id:
-                cur.execute(
-                    """SELECT facts, created_at FROM message 
-                        WHERE conversation_id=? AND database_name=? AND role='assistant' AND facts IS NOT NULL 
-                    ORDER BY created_at DESC LIMIT ?""",
-                        (conversation_id, database_name, limit)
-                )
-            else:
-                # No conversation_id = new conversation, return empty facts
-                return ""
-            
+            # Only get facts from THIS conversation
+            cur.execute(
+                """SELECT facts, created_at FROM message 
+                    WHERE conversation_id=? AND database_name=? AND role='assistant' AND facts IS NOT NULL 
+                ORDER BY created_at DESC LIMIT ?""",
+                    (conversation_id, database_name, limit)
+            )
             rows = cur.fetchall()
-            
-            if not rows:
-                return ""
-            
-            # Combine recent facts
-            past_facts = []
-            for row in rows:
-                if row["facts"]:
-                    past_facts.append(f"Previous exploration: {row['facts']}")
-            
-            return "\n".join(past_facts) if past_facts else ""
+        
+        # Combine recent facts
+        past_facts = []
+        for row in rows:
+            if row["facts"]:
+                past_facts.append(f"Previous exploration: {row['facts']}")
+        
+        facts_text = "\n".join(past_facts) if past_facts else ""
+        _facts_cache.set(cache_key, facts_text)
+        return facts_text
             
     except Exception as e:
         print(f"Error getting past facts: {e}")
@@ -1054,6 +1538,15 @@ def get_past_facts(database_name: str, limit: int = 10, conversation_id: str | N
 # Initialize LLM with temperature for more creative/diverse outputs
 # Temperature 0.8 provides good balance: varied enough for diverse charts, but still coherent
 llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.8)
+# The markdown answer is the longest generation in a request; cap it so a runaway
+# response cannot dominate latency (3-5 paragraphs plus one chart block fit well inside)
+_CHAT_MAX_TOKENS = int(os.getenv("CHAT_MAX_TOKENS", "900"))
+chat_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.8, max_tokens=_CHAT_MAX_TOKENS)
+# NoQL generation model, built once so every question reuses its client and connection pool
+noql_llm = ChatOpenAI(model_name="gpt-3.5-turbo")
+
+_LIMIT_RE = re.compile(r"\bLIMIT\s+\d+\b", re.IGNORECASE)
+_SELECT_RE = re.compile(r"SELECT\b", re.IGNORECASE)
 
 # Ensure queries include a LIMIT to avoid huge result sets
 def ensure_limit(query: str, default_limit: int = 50) -> str:
@@ -1061,22 +1554,25 @@ def ensure_limit(query: str, default_limit: int = 50) -> str:
         if not isinstance(query, str):
             return query
         q = query.strip()
+        # If LIMIT already present, keep as-is
+        if _LIMIT_RE.search(q):
+            return query
+        # Only apply to SELECT queries (q is already stripped, so match at position 0)
+        if not _SELECT_RE.match(q):
+            return query
         # Remove trailing semicolon for uniform handling
         has_semicolon = q.endswith(';')
         if has_semicolon:
             q = q[:-1]
-        # If LIMIT already present, keep as-is
-        import re
-        if re.search(r"\bLIMIT\s+\d+\b", q, re.IGNORECASE):
-            return query
-        # Only apply to SELECT queries
-        if re.match(r"^\s*SELECT\b", q, re.IGNORECASE):
-            q = f"{q} LIMIT {int(default_limit)}"
-            return q + (';' if has_semicolon else '')
-        return query
+        return f"{q} LIMIT {int(default_limit)}" + (';' if has_semicolon else '')
     except Exception:
         return query
 
+# Opening fence with optional language tag, or any other triple backtick
+_QUERY_FENCE_RE = re.compile(r"^`{3,}(?:noql|sql)?|```", re.IGNORECASE)
+# Query wrapped in a matching pair of quotes
+_QUOTED_QUERY_RE = re.compile(r"""^(["'])(.*)\1$""", re.DOTALL)
+
 # Best-effort sanitizer for quick exploratory NoQL queries
 # Generic cleaner for any NoQL query emitted by the LLM
 def _strip_query_fences(q) -> str:
@@ -1085,19 +1581,12 @@ def _strip_query_fences(q) -> str:
         if not isinstance(q, str):
             q = str(q)
         
-        s = q.strip()
         # remove triple backtick blocks and optional language tag
-        if s.startswith('```'):
-            s = s.lstrip('`')
-            # remove leading language tag like sql, noql, etc.
-            if len(s) >= 4 and s[:4].lower() == 'noql':
-                s = s[4:].lstrip()
-            elif len(s) >= 3 and s[:3].lower() == 'sql':
-                s = s[3:].lstrip()
-        s = s.replace('```', '').strip()
+        s = _QUERY_FENCE_RE.sub('', q.strip()).strip()
         # remove surrounding quotes if any
-        if len(s) >= 2 and ((s.startswith('"') and s.endswith('"')) or (s.startswith("'") and s.endswith("'"))):
-            s = s[1:-1].strip()
+        m = _QUOTED_QUERY_RE.match(s)
+        if m:
+            s = m.group(2).strip()
         return s
     except Exception:
         # Fallback: convert to string and return
@@ -1107,17 +1596,116 @@ def _strip_query_fences(q) -> str:
             return ""
 
 # Normalize query: strip fences and enforce limit
+@functools.lru_cache(maxsize=1024)
 def normalize_query(query: str, limit: int = 50) -> str:
-    """Normalize a NoQL query by stripping markdown fences and ensuring LIMIT clause."""
+    """Normalize a NoQL query by stripping markdown fences and ensuring LIMIT clause.
+
+    Pure over its arguments, so results are memoized; exploration probes repeat often and
+    run_query re-normalizes queries that were already normalized by the caller.
+    """
     query = _strip_query_fences(query)
     query = ensure_limit(query, limit)
     return query
 
-# ChatGPT-style markdown generation prompt with selective chart embedding (grounded)
-chat_markdown_prompt = ChatPromptTemplate.from_template("""
-You are having a natural conversation about CRM data and insights. Write as if you're talking to a colleague - friendly, informative, and conversational, but still professional and business-focused.
+# Conversational style examples for the chat prompt. Only the ones closest to the
+# question are sent, which keeps the static system prefix short.
+_STYLE_EXAMPLES = (
+    (
+        frozenset("lead leads status statuses pipeline funnel".split()),
+        """**Lead Status Distribution**
+"What are the leads by status?"
+"Looking at your current pipeline, I can see the leads are spread across different stages pretty evenly. Most of them are actively being worked on, which is good - you've got movement in the funnel.
 
-User asked: {question}
+```chart
+{{"type": "bar", "question": "Distribution of leads by status", "title": "Leads by Status", "db": "zigment"}}
+```
+
+What's interesting is that you have a good mix of leads in progress and converted ones. The fact that you're seeing leads move through the stages suggests your follow-up process is working. You might want to focus on pushing those in-progress ones toward conversion if possible.\"""",
+    ),
+    (
+        frozenset("source sources performance perform best marketing campaign campaigns".split()),
+        """**Source Performance Analysis**
+"Which lead sources perform best?"
+"I pulled up the numbers on your lead sources, and there's definitely a clear winner here. Some channels are bringing in not just more leads, but better quality ones that actually convert.
+
+```chart
+{{"type": "bar", "question": "Conversion rates by lead source", "title": "Lead Source Performance", "db": "zigment"}}
+```
+
+This is really useful because it tells you where to focus your marketing budget. If one source is giving you high volumes but low conversion, and another is the opposite, you might want to double down on what's actually working.\"""",
+    ),
+    (
+        frozenset("channel channels whatsapp email sms engagement effective communication messages".split()),
+        """**Channel Engagement**
+"Which communication channels are most effective?"
+"So I looked at where you're getting the most engagement, and it's pretty clear which channels your contacts prefer. WhatsApp seems to be where most of the action happens.
+
+```chart
+{{"type": "pie", "question": "Distribution of messages by channel", "title": "Messages by Channel", "db": "zigment"}}
+```
+
+This makes sense - people tend to respond faster on channels they use regularly. You might want to prioritize outreach on the channels where you're seeing the most engagement, since that's where your contacts are actually active.\"""",
+    ),
+    (
+        frozenset("trend trends time monthly month months weekly week daily growth conversion conversions".split()),
+        """**Conversion Trends**
+"Show conversion trends over time"
+"I tracked your conversions over the past few months, and there's a pretty interesting pattern here. You had some strong months, then things dipped a bit, and now it's picking back up.
+
+```chart
+{{"type": "line", "question": "Monthly conversion rates over the last 12 months", "title": "Conversion Trend Analysis", "db": "zigment"}}
+```
+
+The trend shows some seasonality which is normal, but what I'd watch is whether those dips are something you can address. Maybe there's a pattern - like certain campaigns perform better at certain times, or maybe it's about following up faster when leads come in.\"""",
+    ),
+    (
+        frozenset("times day days hour hours hourly activity active peak when".split()),
+        """**Contact Activity Patterns**
+"What times of day see the most contact activity?"
+"This is cool - I looked at when your contacts are most active, and there's a clear pattern. Most of the engagement happens during business hours, which makes total sense.
+
+```chart
+{{"type": "bar", "question": "Contact activity by time ranges", "title": "Daily Activity Patterns", "db": "zigment"}}
+```
+
+The peak times are mid-morning and early afternoon. So if you're doing outreach, that's probably when you'll get the best response rates. Early morning or late evening might work for some people, but the bulk of activity is when you'd expect - during normal business hours.\"""",
+    ),
+    (
+        frozenset("lifecycle stage stages journey breakdown".split()),
+        """**Lifecycle Stage Distribution**
+"What's the breakdown by lifecycle stage?"
+"Looking at where your contacts are in the journey, I can see most of them are in the middle stages - which is actually pretty good. It means they're progressing, not stuck at the beginning.
+
+```chart
+{{"type": "bar", "question": "Contacts by lifecycle stage", "title": "Lifecycle Stage Analysis", "db": "zigment"}}
+```
+
+What I'd pay attention to is if there's a stage where contacts are getting stuck. If you see a huge pile-up at one stage, that's probably where you need to focus more effort - maybe it needs better nurturing or a different approach.\"""",
+    ),
+)
+_STYLE_DEFAULT = (0, 3)  # a bar and a line example when nothing matches
+_STYLE_TOKEN_RE = re.compile(r"[a-z]+")
+
+@functools.lru_cache(maxsize=1024)
+def select_style_examples(question: str, k: int = 2) -> str:
+    """Render the k style examples whose keywords best overlap the question."""
+    words = set(_STYLE_TOKEN_RE.findall(question.lower()))
+    scored = sorted(
+        ((len(words & keywords), -idx) for idx, (keywords, _) in enumerate(_STYLE_EXAMPLES)),
+        reverse=True,
+    )
+    picked = [-neg_idx for score, neg_idx in scored[:k] if score > 0]
+    picked += [idx for idx in _STYLE_DEFAULT if idx not in picked][:k - len(picked)]
+    return "\n\n".join(
+        f"**EXAMPLE {n}: {_STYLE_EXAMPLES[idx][1][2:]}" for n, idx in enumerate(sorted(picked), 1)
+    )
+
+# ChatGPT-style markdown generation prompt with selective chart embedding (grounded)
+# Static instructions and the schema form the system prefix so it is byte-identical
+# across requests and eligible for provider-side prompt caching; per-request data
+# (question, samples, history, facts) goes last in the user turn.
+chat_markdown_prompt = ChatPromptTemplate.from_messages([
+    ("system", """You are having a natural conversation about CRM data and insights. Write as if you're talking to a colleague - friendly, informative, and conversational, but still professional and business-focused.
 
 🎯 **CRITICAL: ANSWER EXACTLY WHAT WAS ASKED**
 - Be conversational, not formal or robotic
@@ -1126,21 +1714,6 @@ User asked: {question}
 - Don't mention database names or technical details - just discuss the findings naturally
 - Write like you're explaining to a friend who needs the insights
 
-ACTUAL DATABASE SCHEMA:
-{schema}
-
-SAMPLE DATA (first few rows per table):
-{samples}
-
-Recent conversation (most recent last). Use this context to maintain continuity and build on previous points naturally. Do NOT restate earlier content verbatim:
-{history}
-
-Facts (ground truth; ONLY use these for numeric claims):
-{facts}
-
-AllowedEntities (you may ONLY reference these specific entities by name; otherwise use generic terms):
-{allowed_entities}
-
 Write a conversational response (3-5 paragraphs). Talk naturally about the data:
 - Start by acknowledging what they're asking about and give a quick overview
 - Walk through what the data shows in a conversational way
@@ -1401,76 +1974,44 @@ When a chart would help illustrate your points, mention it naturally:
 - ❌ Using pie chart for >6 categories (use bar instead)
 - ❌ Using bar chart for time series trends (use line instead)
 
-Examples of conversational style for CRM data:
-
-**EXAMPLE 1: Lead Status Distribution**
-"What are the leads by status?"
-"Looking at your current pipeline, I can see the leads are spread across different stages pretty evenly. Most of them are actively being worked on, which is good - you've got movement in the funnel.
-
-```chart
-{{"type": "bar", "question": "Distribution of leads by status", "title": "Leads by Status", "db": "zigment"}}
-```
-
-What's interesting is that you have a good mix of leads in progress and converted ones. The fact that you're seeing leads move through the stages suggests your follow-up process is working. You might want to focus on pushing those in-progress ones toward conversion if possible."
-
-**EXAMPLE 2: Source Performance Analysis**
-"Which lead sources perform best?"
-"I pulled up the numbers on your lead sources, and there's definitely a clear winner here. Some channels are bringing in not just more leads, but better quality ones that actually convert.
-
-```chart
-{{"type": "bar", "question": "Conversion rates by lead source", "title": "Lead Source Performance", "db": "zigment"}}
-```
-
-This is really useful because it tells you where to focus your marketing budget. If one source is giving you high volumes but low conversion, and another is the opposite, you might want to double down on what's actually working."
-
-**EXAMPLE 3: Channel Engagement**
-"Which communication channels are most effective?"
-"So I looked at where you're getting the most engagement, and it's pretty clear which channels your contacts prefer. WhatsApp seems to be where most of the action happens.
-
-```chart
-{{"type": "pie", "question": "Distribution of messages by channel", "title": "Messages by Channel", "db": "zigment"}}
-```
-
-This makes sense - people tend to respond faster on channels they use regularly. You might want to prioritize outreach on the channels where you're seeing the most engagement, since that's where your contacts are actually active."
-
-**EXAMPLE 4: Conversion Trends**
-"Show conversion trends over time"
-"I tracked your conversions over the past few months, and there's a pretty interesting pattern here. You had some strong months, then things dipped a bit, and now it's picking back up.
-
-```chart
-{{"type": "line", "question": "Monthly conversion rates over the last 12 months", "title": "Conversion Trend Analysis", "db": "zigment"}}
-```
+**CONVERSATIONAL STRUCTURE:**
+1. **Natural Opening**: Acknowledge what they asked, maybe with a quick observation
+2. **Walk Through the Data**: Talk through what you see in the chart naturally, like explaining to a friend
+3. **Share Insights**: Point out interesting patterns or what stands out to you
+4. **Actionable Thoughts**: Suggest what they might want to consider, but do it conversationally
 
-The trend shows some seasonality which is normal, but what I'd watch is whether those dips are something you can address. Maybe there's a pattern - like certain campaigns perform better at certain times, or maybe it's about following up faster when leads come in."
+Write like you're having a friendly chat with someone who needs insights, not like you're delivering a formal presentation. Be engaging, natural, and helpful.
 
-**EXAMPLE 5: Contact Activity Patterns**
-"What times of day see the most contact activity?"
-"This is cool - I looked at when your contacts are most active, and there's a clear pattern. Most of the engagement happens during business hours, which makes total sense.
+ACTUAL DATABASE SCHEMA:
+{schema}
+"""),
+    ("human", """
+User asked: {question}
 
-```chart
-{{"type": "bar", "question": "Contact activity by time ranges", "title": "Daily Activity Patterns", "db": "zigment"}}
-```
+SAMPLE DATA (first few rows per table):
+{samples}
 
-The peak times are mid-morning and early afternoon. So if you're doing outreach, that's probably when you'll get the best response rates. Early morning or late evening might work for some people, but the bulk of activity is when you'd expect - during normal business hours."
+Recent conversation (most recent last). Use this context to maintain continuity and build on previous points naturally. Do NOT restate earlier content verbatim:
+{history}
 
-**EXAMPLE 6: Lifecycle Stage Distribution**
-"What's the breakdown by lifecycle stage?"
-"Looking at where your contacts are in the journey, I can see most of them are in the middle stages - which is actually pretty good. It means they're progressing, not stuck at the beginning.
+Facts (ground truth; ONLY use these for numeric claims):
+{facts}
 
-```chart
-{{"type": "bar", "question": "Contacts by lifecycle stage", "title": "Lifecycle Stage Analysis", "db": "zigment"}}
-```
+AllowedEntities (you may ONLY reference these specific entities by name; otherwise use generic terms):
+{allowed_entities}
 
-What I'd pay attention to is if there's a stage where contacts are getting stuck. If you see a huge pile-up at one stage, that's probably where you need to focus more effort - maybe it needs better nurturing or a different approach."
+Examples of conversational style for CRM data:
 
-**CONVERSATIONAL STRUCTURE:**
-1. **Natural Opening**: Acknowledge what they asked, maybe with a quick observation
-2. **Walk Through the Data**: Talk through what you see in the chart naturally, like explaining to a friend
-3. **Share Insights**: Point out interesting patterns or what stands out to you
-4. **Actionable Thoughts**: Suggest what they might want to consider, but do it conversationally
+{style_examples}
+"""),
+])
+_CHAT_MARKDOWN_CHAIN = chat_markdown_prompt | chat_llm | StrOutputParser()
 
-Write like you're having a friendly chat with someone who needs insights, not like you're delivering a formal presentation. Be engaging, natural, and helpful.
-""")
+# Condenses the oldest turns of long conversations into a stored summary
+summary_prompt = ChatPromptTemplate.from_template(
+    """Summarize the following chat turns into 4-6 concise bullet points capturing key facts, user intent, and decisions. Keep numbers if present.\n\n{content}\n\nSummary:"""
+)
+_SUMMARY_CHAIN = summary_prompt | llm | StrOutputParser()
 
 # Grounding/rewrite prompt to ensure prose uses only chart-derived facts
 grounding_prompt = ChatPromptTemplate.from_template("""
@@ -1735,6 +2276,13 @@ Prior facts:
 """
 )
 
+# Structured-output calls use JSON mode, so the reply is always a single parseable object
+_JSON_MODE = {"type": "json_object"}
+
+# Built once; the llm and parser hold no per-call state, so the chain is safe to share.
+# deep_explore_prompt is rendered separately so the rendered messages can be reused.
+_EXPLORE_LLM_CHAIN = llm.bind(response_format=_JSON_MODE) | StrOutputParser()
+
 # Helper to format a value safely for facts
 def _fmt(v):
     try:
@@ -1744,8 +2292,100 @@ def _fmt(v):
     except Exception:
         return ""
 
+# Prompt-ready counts/samples/guidance per database; the inputs are cached too, but
+# serializing them and building the guidance text is repeated on every question otherwise
+_exploration_meta_cache = _TTLCache(ttl=180.0, maxsize=32)
+
+# Runs the samples fetch alongside counts; kept apart from _NOQL_POOL, which both fan out onto
+_METADATA_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="metadata")
+
+def _build_exploration_metadata(database_name: str) -> tuple[str, str, str, str]:
+    samples_future = _METADATA_POOL.submit(sample_database_tables, database_name)
+    counts_data = get_table_and_column_counts(database_name)
+    counts_text = _json_head(counts_data, 2000)
+    samples_text = _json_head(_columnar_samples(samples_future.result()), 2000)
+    table_guidance = generate_table_size_guidance(counts_data, threshold=100000)
+    # Hashed once here so per-question cache keys don't rehash the prompt text
+    digest = hashlib.blake2b(
+        "\x1f".join((_SCHEMA_FINGERPRINT, counts_text, samples_text)).encode(), digest_size=16
+    ).hexdigest()
+    return counts_text, samples_text, table_guidance, digest
+
+def get_exploration_metadata(database_name: str) -> tuple[str, str, str, str]:
+    """Return (counts_text, samples_text, table_guidance, digest) for the exploration prompt.
+
+    `digest` covers the schema fingerprint and both texts (guidance derives from the counts).
+    """
+    return _exploration_meta_cache.get_or_fetch(
+        (database_name,),
+        lambda: _build_exploration_metadata(database_name),
+        # Only keep it once the counts themselves were good enough to cache
+        should_cache=lambda meta: _table_counts_cache.get((database_name,)) is not _TTLCache._MISS,
+    )
+
+def invalidate_metadata(database_name: str):
+    """Drop cached counts, samples (and their text), exploration prompt metadata and passive facts for a database."""
+    for cache in (_table_counts_cache, _table_samples_cache, _samples_text_cache, _exploration_meta_cache,
+                  _passive_facts_cache):
+        cache.invalidate_prefix(database_name)
+    drop_persisted_counts(database_name)
+
+# Exploration probes repeat across questions and conversations; keep recent results briefly
+_exploration_result_cache = _TTLCache(ttl=120.0, maxsize=512)
+# Row budget for probes: injected as LIMIT and enforced again on the response
+_EXPLORATION_MAX_ROWS = 20
+_WHITESPACE_RE = re.compile(r"\s+")
+_VOLATILE_QUERY_RE = re.compile(r"\b(?:NOW|CURDATE|CURRENT_DATE|CURRENT_TIMESTAMP|UNIX_TIMESTAMP|RAND)\s*\(", re.I)
+
+@functools.lru_cache(maxsize=512)
+def _prepare_exploration_query(noql_query: str, max_rows: int = _EXPLORATION_MAX_ROWS) -> tuple[str, str | None]:
+    """One pass over an LLM probe: strip fences, enforce LIMIT and derive the result-cache key.
+
+    Returns (clean_query, cache_text); cache_text is None for time-dependent queries.
+    """
+    # Schema validation disabled - using hardcoded schema
+    clean_query = normalize_query(noql_query, max_rows)
+    if _VOLATILE_QUERY_RE.search(clean_query):
+        return clean_query, None
+    return clean_query, _WHITESPACE_RE.sub(" ", clean_query).strip()
+
+def _run_exploration_query(clean_query: str, cache_text: str | None, database_name: str):
+    """run_query(..., return_columns=True) memoized on (database, whitespace-normalized query)."""
+    cache_key = (database_name, cache_text)
+    if cache_text is not None:
+        cached = _exploration_result_cache.get(cache_key)
+        if cached is not _TTLCache._MISS:
+            return cached
+    rows, columns = run_query(clean_query, database_name, return_columns=True, normalized=True, max_rows=_EXPLORATION_MAX_ROWS)
+    # Empty results may be transient API errors
+    if rows and cache_text is not None:
+        _exploration_result_cache.set(cache_key, (rows, columns))
+    return rows, columns
+
+# Upper bound on waiting for one probe; the HTTP call itself times out at 30s
+_EXPLORATION_QUERY_TIMEOUT = 45.0
+
+def _run_exploration_probe(noql_query: str, database_name: str):
+    """Prepare and run one exploration query; returns (clean_query, rows, columns, elapsed)."""
+    t1 = time.time()
+    clean_query, cache_text = _prepare_exploration_query(noql_query)
+    rows, columns = _run_exploration_query(clean_query, cache_text, database_name)
+    return clean_query, rows, columns, time.time() - t1
+
+# Per-step timing output for run_deep_exploration; set EXPLORE_TIMING=1 to enable
+_DEBUG_TIMING = os.getenv("EXPLORE_TIMING") == "1"
+
+# Parsed-OK LLM exploration plans, keyed by a digest of the prompt inputs
+_exploration_plan_cache = _TTLCache(ttl=600.0, maxsize=256)
+# Rendered deep_explore_prompt messages for the same inputs (large; keep few)
+_exploration_prompt_cache = _TTLCache(ttl=600.0, maxsize=32)
+
+# Finished explorations per (database, normalized question) as (result, True); only successful runs are stored
+_exploration_facts_cache = _TTLCache(ttl=900.0, maxsize=512)
+_NON_WORD_RE = re.compile(r"\W+")
+
 # Active exploration using deep_explore_prompt
-def run_deep_exploration(question: str, database_name: str, max_queries: int = 3, conversation_id: str | None = None) -> dict:
+def run_deep_exploration(question: str, database_name: str, max_queries: int = 3, conversation_id: str | None = None, force_refresh: bool = False) -> dict:
     """Use deep_explore_prompt to generate targeted exploratory queries based on the question
     
     Args:
@@ -1753,8 +2393,32 @@ def run_deep_exploration(question: str, database_name: str, max_queries: int = 3
         database_name: Database to explore
         max_queries: Maximum number of exploratory queries to run
         conversation_id: Optional conversation ID to scope facts to current conversation
+        force_refresh: Ask the LLM for a new exploration plan even if one is cached
     """
     print(f"\n🔎 === DEEP EXPLORATION ({database_name}) — intelligent probing ===")
+    # Repeated intent (same words, any case/punctuation) over the same prior facts reuses the
+    # earlier exploration outright; the facts are part of the key because the plan is built from
+    # them, so a follow-up in one conversation never gets another conversation's results
+    prior_facts = get_past_facts(database_name, limit=5, conversation_id=conversation_id)
+    prior_digest = hashlib.blake2b(prior_facts.encode(), digest_size=16).hexdigest()
+    result_key = (database_name, _NON_WORD_RE.sub(" ", question.lower()).strip(), prior_digest)
+    explore = lambda: _explore_question(question, database_name, max_queries, conversation_id, force_refresh)
+    if force_refresh:
+        result, cacheable = explore()
+        if cacheable:
+            _exploration_facts_cache.set(result_key, (result, cacheable))
+        return dict(result)
+    
+    cached = _exploration_facts_cache.get(result_key)
+    if cached is not _TTLCache._MISS:
+        print("🔎 Deep exploration reused from cache\n")
+        return dict(cached[0])
+    # Concurrent turns with the same intent wait on the first one instead of probing again
+    result, _ = _exploration_facts_cache.get_or_fetch(result_key, explore, should_cache=lambda entry: entry[1])
+    return dict(result)
+
+def _explore_question(question: str, database_name: str, max_queries: int, conversation_id: str | None, force_refresh: bool) -> tuple[dict, bool]:
+    """One deep exploration pass; returns (result, cacheable). Fallback results are not cacheable."""
     import time
     start_time = time.time()
     
@@ -1764,16 +2428,14 @@ def run_deep_exploration(question: str, database_name: str, max_queries: int = 3
     try:
         # Get schema, counts and samples for the prompt
         t1 = time.time()
-        schema_text = _SCHEMA_JSON
-        print(f"Schema fetch: {time.time()-t1:.2f}s")
+        schema_text = _SCHEMA_PROMPT_TEXT
+        if _DEBUG_TIMING:
+            print(f"Schema fetch: {time.time()-t1:.2f}s")
         
         t1 = time.time()
-        counts_data = get_table_and_column_counts(database_name)
-        print(f"Counts fetch: {time.time()-t1:.2f}s")
-        
-        counts_text = safe_json_dumps(counts_data, ensure_ascii=False)[:2000]
-        samples_text = safe_json_dumps(sample_database_tables(database_name), ensure_ascii=False)[:2000]
-        table_guidance = generate_table_size_guidance(counts_data, threshold=100000)
+        counts_text, samples_text, table_guidance, metadata_digest = get_exploration_metadata(database_name)
+        if _DEBUG_TIMING:
+            print(f"Counts fetch: {time.time()-t1:.2f}s")
         
         # Get past facts for this conversation only (not from other conversations)
         past_facts = get_past_facts(database_name, limit=5, conversation_id=conversation_id)
@@ -1794,49 +2456,42 @@ def run_deep_exploration(question: str, database_name: str, max_queries: int = 3
             "table_size_guidance": table_guidance
         }
         
-        chain = (
-            deep_explore_prompt
-            | llm.bind(stop=["\nResult:"])
-            | StrOutputParser()
-        )
-        
-        # Generate exploration queries
-        t1 = time.time()
-        response = chain.invoke(input_data)
-        print(f"LLM call: {time.time()-t1:.2f}s")
+        # Generate exploration queries, reusing a recent plan for identical prompt inputs
+        plan_digest = hashlib.blake2b(
+            "\x1f".join((question.strip().lower(), metadata_digest, prior_facts_text)).encode(),
+            digest_size=16,
+        ).hexdigest()
+        plan_key = (database_name, plan_digest)
+        response = _TTLCache._MISS if force_refresh else _exploration_plan_cache.get(plan_key)
+        if response is _TTLCache._MISS:
+            # Rendered messages survive an unparseable response, so a retry skips re-rendering
+            prompt_key = (database_name, plan_digest, question)
+            prompt_messages = _exploration_prompt_cache.get(prompt_key)
+            if prompt_messages is _TTLCache._MISS:
+                prompt_messages = deep_explore_prompt.format(**input_data)
+                _exploration_prompt_cache.set(prompt_key, prompt_messages)
+            t1 = time.time()
+            response = _EXPLORE_LLM_CHAIN.invoke(prompt_messages)
+            if _DEBUG_TIMING:
+                print(f"LLM call: {time.time()-t1:.2f}s")
+        else:
+            print("LLM call: skipped (cached exploration plan)")
         
         print(f"LLM exploration response: {response}")
         
-        # Parse the JSON response - strip markdown fences if present
+        # JSON mode guarantees a bare object; a parse error falls through to the passive fallback
         try:
             # Ensure response is a string
             if not isinstance(response, str):
                 response = str(response)
             
-            # Clean the response by removing markdown fences
-            json_text = response.strip()
-            if json_text.startswith('```'):
-                # Find the actual JSON content between fences
-                lines = json_text.split('\n')
-                start_idx = 0
-                end_idx = len(lines)
-                
-                # Skip the opening fence line
-                if lines[0].startswith('```'):
-                    start_idx = 1
-                
-                # Find the closing fence
-                for i in range(len(lines)-1, -1, -1):
-                    if lines[i].strip() == '```':
-                        end_idx = i
-                        break
-
-                json_text = '\n'.join(lines[start_idx:end_idx]).strip()
-            
-            exploration_data = json.loads(json_text)
+            exploration_data = orjson.loads(response)
             explorations = exploration_data.get("explorations", [])
+            _exploration_plan_cache.set(plan_key, response)
             
-            # Execute each exploration query
+            # Start every probe up front; they are independent read-only queries, so
+            # the DB phase costs the slowest probe rather than the sum of all of them
+            probes = []
             for i, exploration in enumerate(explorations[:max_queries]):
                 purpose = exploration.get("purpose", f"Query {i+1}")
                 noql_query = exploration.get("sql", "")
@@ -1846,32 +2501,25 @@ def run_deep_exploration(question: str, database_name: str, max_queries: int = 3
                     
                 print(f"Exploration {i+1}: {purpose}")
                 print(f"   Query: {noql_query}")
-                
+                probes.append((purpose, _NOQL_POOL.submit(_run_exploration_probe, noql_query, database_name)))
+            
+            # Collect results in plan order
+            for purpose, future in probes:
                 try:
-                    # Strip query fences and execute
-                    t1 = time.time()
-                    clean_query = normalize_query(noql_query, 20)
-                    
-                    # Schema validation disabled - using hardcoded schema
-                    
-                    rows, columns = run_query(clean_query, database_name, return_columns=True)
-                    print(f"   Query execution: {time.time()-t1:.2f}s")
+                    clean_query, rows, columns, elapsed = future.result(timeout=_EXPLORATION_QUERY_TIMEOUT)
+                    if _DEBUG_TIMING:
+                        print(f"   Query execution ({purpose}): {elapsed:.2f}s")
                     
                     if rows:
                         print(f"   SUCCESS: Found {len(rows)} results")
                         # Add facts from this exploration
                         facts.append(f"{purpose}: {len(rows)} records found")
                         
-                        # Extract allowed entities from string columns
-                        for row in rows[:5]:  # First 5 rows
-                            for cell in row:
-                                if isinstance(cell, (str, bytes)) and len(str(cell)) > 2:
-                                    try:
-                                        entity = str(cell)[:80].strip()
-                                        if entity and not entity.isdigit():
-                                            allowed.add(entity)
-                                    except Exception:
-                                        pass
+                        # Extract allowed entities from string columns of the first 5 rows
+                        cells = (str(cell) for row in rows[:5] for cell in row if isinstance(cell, (str, bytes)))
+                        entities = (text[:80].strip() for text in cells if len(text) > 2)
+                        # Entities (<= 80 chars) recur across probes and cached results; intern ASCII ones
+                        allowed.update(sys.intern(e) if e.isascii() else e for e in entities if e and not e.isdigit())
                         
                         # Add some specific facts from the data
                         if len(rows) > 0 and len(columns) >= 2:
@@ -1894,51 +2542,128 @@ def run_deep_exploration(question: str, database_name: str, max_queries: int = 3
             print(f"⚠️ Failed to parse exploration JSON: {e}")
             print(f"Raw response: {response[:500]}...")
             print(f"🔄 Falling back to passive exploration for {database_name}")
-            return passive_exploration_fallback(database_name)
+            return passive_exploration_fallback(database_name), False
             
     except Exception as e:
         print(f"⚠️ Deep exploration failed: {e}")
         # Fallback to passive sampling
-        return passive_exploration_fallback(database_name)
+        return passive_exploration_fallback(database_name), False
     
     facts_text = "\n".join(facts) if facts else "(no exploration facts)"
     allowed_text = "\n".join(sorted(allowed)) if allowed else "(none)"
     
-    print(f"⏱️ TOTAL DEEP EXPLORATION TIME: {time.time()-start_time:.2f}s")
+    if _DEBUG_TIMING:
+        print(f"⏱️ TOTAL DEEP EXPLORATION TIME: {time.time()-start_time:.2f}s")
     print(f"🔎 Deep exploration complete. Facts: {len(facts)} | Allowed entities: {len(allowed)}\n")
-    return {"facts": facts_text, "allowed": allowed_text}
+    return {"facts": facts_text, "allowed": allowed_text}, bool(facts)
 
 # Fallback passive exploration (original method)
+# Passive facts depend only on the database contents, so every conversation shares them
+_passive_facts_cache = _TTLCache(ttl=300.0, maxsize=64)
+_NO_PASSIVE_FACTS = "(no precomputed facts)"
+# Entity names beyond this add prompt bytes without helping grounding
+_PASSIVE_ALLOWED_MAX = 500
+
 def passive_exploration_fallback(database_name: str) -> dict:
     """Fallback to original passive sampling method"""
     print(f"🔄 Falling back to passive exploration for {database_name}")
+    return _passive_facts_cache.get_or_fetch(
+        (database_name, _SCHEMA_FINGERPRINT),
+        lambda: _build_passive_facts(database_name),
+        should_cache=lambda result: result["facts"] != _NO_PASSIVE_FACTS,
+    )
+
+def _extract_allowed(rows, max_rows: int = 3, max_cells: int = 2,
+                     _isinstance=isinstance, _str=str, _islice=itertools.islice, _text=(str, bytes)):
+    """String-like values from the leading cells of the first rows, clipped to 80 chars."""
+    return {
+        _str(cell)[:80]
+        for row in rows[:max_rows]
+        for cell in _islice(row.values() if _isinstance(row, dict) else row, max_cells)
+        if _isinstance(cell, _text)
+    }
+
+def _build_passive_facts(database_name: str) -> dict:
     facts: list[str] = []
     allowed: set[str] = set()
+    _isinstance = isinstance
     try:
         samples = sample_database_tables(database_name, max_rows=5, max_tables=100)
         for tname, info in samples.items():
-            if isinstance(info, dict) and info.get('error'):
+            if _isinstance(info, dict) and info.get('error'):
                 facts.append(f"table {tname}: preview error")
                 continue
-            cols = (info or {}).get('columns') or []
-            rows = (info or {}).get('rows') or []
+            # Samples are row lists; older callers passed {"columns", "rows"} dicts
+            if _isinstance(info, dict):
+                cols = info.get('columns') or []
+                rows = info.get('rows') or []
+            else:
+                rows = info or []
+                cols = list(rows[0]) if rows and _isinstance(rows[0], dict) else []
             facts.append(f"table {tname}: {len(cols)} columns, {len(rows)} sample rows")
             # Add some string-like values from first two columns as allowed entities
-            for row in rows[:3]:
-                for cell in list(row)[:2]:
-                    if isinstance(cell, (str, bytes)):
-                        try:
-                            allowed.add(str(cell)[:80])
-                        except Exception:
-                            continue
-            
+            if len(allowed) < _PASSIVE_ALLOWED_MAX:
+                allowed.update(_extract_allowed(rows))
     except Exception as e:
         print(f"⚠️ Passive sampling failed: {e}")
 
-    facts_text = "\n".join(facts) if facts else "(no precomputed facts)"
-    allowed_text = "\n".join(sorted(allowed)) if allowed else "(none)"
+    facts_text = "\n".join(facts) if facts else _NO_PASSIVE_FACTS
+    # Tables are sampled in a fixed order, so the capped set (and the prompt text) is stable
+    allowed_text = "\n".join(sorted(allowed)[:_PASSIVE_ALLOWED_MAX]) if allowed else "(none)"
     return {"facts": facts_text, "allowed": allowed_text}
 
+# Local casual-vs-data scorer: a logistic over unigram/bigram weights taken from the
+# classification rules below. Positive weights lean casual, negative lean data.
+_INTENT_WEIGHTS = {
+    # casual
+    "hi": 3.0, "hello": 3.0, "hey": 3.0, "hiya": 3.0, "yo": 2.0,
+    "good morning": 2.5, "good afternoon": 2.5, "good evening": 2.5,
+    "how are": 2.5, "how's it": 2.5, "what's up": 2.5, "sup": 2.0,
+    "thanks": 3.0, "thank": 2.5, "thx": 3.0, "ty": 2.5, "appreciate": 2.0,
+    "bye": 3.0, "goodbye": 3.0, "cya": 3.0, "see you": 2.5,
+    "cool": 2.0, "nice": 2.0, "awesome": 2.0, "great": 1.5, "okay": 2.0, "ok": 2.0,
+    "lol": 3.0, "haha": 3.0,
+    "who are": 2.5, "what are you": 2.5, "your name": 2.5, "what can": 2.0, "what do you do": 2.0,
+    # data
+    "show": -3.0, "list": -3.0, "how many": -3.5, "top": -2.5, "compare": -3.0,
+    "analyze": -3.0, "analyse": -3.0, "find": -2.0, "average": -3.0, "avg": -3.0,
+    "total": -3.0, "count": -3.0, "sum": -3.0, "number": -2.0, "distribution": -3.0,
+    "breakdown": -3.0, "revenue": -3.0, "sales": -3.0, "customers": -2.5, "orders": -2.5,
+    "trend": -3.0, "trends": -3.0, "patterns": -2.5, "correlation": -3.0, "correlations": -3.0,
+    "contacts": -2.5, "contact": -2.0, "messages": -2.0, "events": -2.0, "conversations": -2.0,
+    "leads": -2.5, "chart": -3.0, "graph": -3.0, "plot": -3.0, "per": -1.5, "by": -1.0,
+    "most": -1.5, "last": -1.0, "week": -2.0, "month": -2.0, "year": -2.0,
+}
+_INTENT_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_CASUAL_CONFIDENT = 0.85
+_CASUAL_PHRASE = (
+    r"(?:hi|hello|hey|good (?:morning|afternoon|evening)|how (?:are|r) (?:you|u)|thanks|thank you|ty|thx"
+    r"|bye|goodbye|see you|cya|who are you|what are you|your name|what can you do|lol|haha|awesome)"
+)
+# Whole message made only of casual phrases ("hi", "thanks!", "hey, how are you?"); anything
+# more, like "hi, which contacts converted?", goes on to the scorer/LLM
+_CASUAL_RE = re.compile(
+    rf"\s*{_CASUAL_PHRASE}(?:[\s!.?,]+{_CASUAL_PHRASE})*[\s!.?,]*",
+    re.IGNORECASE,
+)
+_DATA_QUERY_RE = re.compile(
+    r"\b(select|count|average|avg|sum|group by|top \d+|how many|show me|list|trend|distribution|breakdown)\b",
+    re.IGNORECASE,
+)
+_CASUAL_MAX_LEN = 40
+_DATA_MIN_LEN = 120
+
+def _local_casual_probability(normalized_question: str) -> float:
+    """Probability that an already lowercased message is casual, from keyword weights."""
+    tokens = _INTENT_TOKEN_RE.findall(normalized_question)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    features += [f"{a} {b} {c}" for a, b, c in zip(tokens, tokens[1:], tokens[2:])]
+    z = sum(_INTENT_WEIGHTS.get(f, 0.0) for f in features)
+    z -= sum(1.0 for t in tokens if t.isdigit())
+    # Longer messages are more likely to carry a data request
+    z -= 0.4 * max(0, len(tokens) - 4)
+    return 1.0 / (1.0 + math.exp(-z))
+
 # Detect if query is casual conversation (not data-related) using LLM
 def is_casual_conversation(question: str) -> bool:
     """Use LLM to intelligently detect if the question is casual conversation or a data query"""
@@ -1949,9 +2674,33 @@ def is_casual_conversation(question: str) -> bool:
     if len(question.strip()) < 3:
         return True
     
+    normalized = " ".join(question.lower().split())
+    
+    # Obvious data requests and plain greetings/thanks never need the LLM
+    if _DATA_QUERY_RE.search(normalized):
+        return False
+    if len(normalized) <= _CASUAL_MAX_LEN and _CASUAL_RE.fullmatch(normalized):
+        return True
+    if len(normalized) > _DATA_MIN_LEN:
+        return False
+    
+    # Confident local scores skip the LLM; only the uncertain band is sent to it
+    p_casual = _local_casual_probability(normalized)
+    if p_casual >= _CASUAL_CONFIDENT:
+        return True
+    if p_casual <= 1.0 - _CASUAL_CONFIDENT:
+        return False
+    
     try:
-        # Create a classification prompt
-        classification_prompt = ChatPromptTemplate.from_template("""
+        # Repeated messages ("hi", "thanks", the same data question) reuse the earlier label
+        return _classify_casual(normalized)
+    except Exception as e:
+        print(f"⚠️ LLM classification failed: {e}, defaulting to data query")
+        # On error, default to treating as data query (safer)
+        return False
+
+# Casual/data classification prompt
+classification_prompt = ChatPromptTemplate.from_template("""
 You are a classifier that determines if a user's message is casual conversation or a data/database query.
 
 **User Message:** "{question}"
@@ -1979,49 +2728,51 @@ You are a classifier that determines if a user's message is casual conversation
 - If unsure, default to DATA (better to provide data than miss a query)
 - Focus on the PRIMARY INTENT of the message
 
-**Output:** Reply with ONLY one word - either "CASUAL" or "DATA" (no explanation, no punctuation)
-""")
-        
-        # Call LLM for classification
-        chain = classification_prompt | llm | StrOutputParser()
-        result = chain.invoke({"question": question})
-        # Ensure result is a string
-        if not isinstance(result, str):
-            result = str(result)
-        result = result.strip().upper()
-        
-        # Parse result
-        is_casual = "CASUAL" in result
-        
-        print(f"🤖 LLM Classification: '{question[:50]}...' → {result} ({'CASUAL' if is_casual else 'DATA QUERY'})")
-        
-        return is_casual
-        
-    except Exception as e:
-        print(f"⚠️ LLM classification failed: {e}, defaulting to data query")
-        # On error, default to treating as data query (safer)
-        return False
-
-# Generate casual conversational response
-def generate_casual_response(question: str, database_name: str) -> str:
-    """Generate a friendly, short conversational response without database exploration"""
-    q_lower = question.lower().strip()
-    
-    # Greetings
-    if any(greeting in q_lower for greeting in ['hi', 'hello', 'hey']):
-        return "Hi there! 👋 I'm **Insight**, your AI data analyst. Ask me anything about your database, and I'll help you explore the data with insights and visualizations!"
+**Output:** Reply with ONLY one word - either "CASUAL" or "DATA" (no explanation, no punctuation)
+""")
+_CLASSIFICATION_CHAIN = classification_prompt | llm | StrOutputParser()
+
+@functools.lru_cache(maxsize=4096)
+def _classify_casual(normalized_question: str) -> bool:
+    """LLM casual/data classification on a lowercased, whitespace-collapsed message.
+
+    Exceptions propagate, so failed calls are never memoized.
+    """
+    chain = _CLASSIFICATION_CHAIN
+    result = chain.invoke({"question": normalized_question})
+    # Ensure result is a string
+    if not isinstance(result, str):
+        result = str(result)
+    result = result.strip().upper()
     
-    # How are you
-    if 'how are you' in q_lower or 'how r u' in q_lower:
-        return "I'm doing great, thank you! 😊 Ready to dive into your data. What would you like to explore today?"
+    # Parse result
+    is_casual = "CASUAL" in result
     
-    # Thanks
-    if any(thanks in q_lower for thanks in ['thanks', 'thank you', 'ty', 'thx']):
-        return "You're very welcome! 🙂 Happy to help anytime. Let me know if you need anything else!"
+    print(f"🤖 LLM Classification: '{normalized_question[:50]}...' → {result} ({'CASUAL' if is_casual else 'DATA QUERY'})")
     
-    # What can you do
-    if 'what can you do' in q_lower or 'what do you do' in q_lower or 'help' in q_lower:
-        return f"""I'm **Insight**, your conversational data analyst! Here's what I can do:
+    return is_casual
+
+# Generate casual conversational response
+_CASUAL_PATTERNS = (
+    ("greet", r"\bhi\b|\bhello\b|\bhey\b"),
+    ("howru", r"how are you|how r u"),
+    ("thanks", r"\bthanks\b|\bthank you\b|\bty\b|\bthx\b"),
+    ("whatcan", r"what can you do|what do you do|\bhelp\b"),
+    ("whoru", r"who are you|what are you|your name"),
+    ("bye", r"\bbye\b|\bgoodbye\b|\bsee you\b|\bcya\b"),
+)
+# Categories are tried in the order above and the first one that matches anywhere in the
+# message decides the reply ("thank you! hi" is a greeting, "ok bye, thanks" is thanks)
+_CASUAL_REPLY_PATTERNS = tuple((name, re.compile(pattern, re.IGNORECASE)) for name, pattern in _CASUAL_PATTERNS)
+_CASUAL_REPLIES = {
+    "greet": "Hi there! 👋 I'm **Insight**, your AI data analyst. Ask me anything about your database, and I'll help you explore the data with insights and visualizations!",
+    "howru": "I'm doing great, thank you! 😊 Ready to dive into your data. What would you like to explore today?",
+    "thanks": "You're very welcome! 🙂 Happy to help anytime. Let me know if you need anything else!",
+    "bye": "Goodbye! 👋 It was great exploring data with you. Come back anytime!",
+}
+# Replies that mention the database; formatted per call
+_CASUAL_DB_REPLIES = {
+    "whatcan": """I'm **Insight**, your conversational data analyst! Here's what I can do:
 
 📊 **Natural language queries** - Just ask in plain English, no NoQL needed
 📈 **Smart visualizations** - I automatically create the best charts for your data
@@ -2036,25 +2787,33 @@ def generate_casual_response(question: str, database_name: str) -> str:
 - "Which organizations have the most contacts?"
 - "Show me chat engagement trends over time"
 
-What would you like to discover?"""
-    
-    # Who are you / What are you / What's your name
-    if 'who are you' in q_lower or 'what are you' in q_lower or 'your name' in q_lower:
-        return f"I'm **Insight** 🤖 - your AI-powered data analyst! I turn your questions into NoQL queries, create beautiful visualizations, and help you discover insights in your `{database_name}` database. Think of me as your friendly data expert who speaks plain English! 😊"
+What would you like to discover?""",
+    "whoru": "I'm **Insight** 🤖 - your AI-powered data analyst! I turn your questions into NoQL queries, create beautiful visualizations, and help you discover insights in your `{database_name}` database. Think of me as your friendly data expert who speaks plain English! 😊",
+}
+
+def generate_casual_response(question: str, database_name: str) -> str:
+    """Generate a friendly, short conversational response without database exploration"""
+    q_lower = question.lower().strip()
     
-    # Goodbye
-    if any(bye in q_lower for bye in ['bye', 'goodbye', 'see you', 'cya']):
-        return "Goodbye! 👋 It was great exploring data with you. Come back anytime!"
+    kind = next((name for name, pattern in _CASUAL_REPLY_PATTERNS if pattern.search(q_lower)), None)
+    if kind is not None:
+        logger.debug("Casual reply: %s", kind)
+        reply = _CASUAL_REPLIES.get(kind)
+        if reply is not None:
+            return reply
+        return _CASUAL_DB_REPLIES[kind].format(database_name=database_name)
     
     # Default short acknowledgment
     if len(q_lower) < 10:
+        logger.debug("Casual reply: short")
         return "I'm here to help! Ask me anything about your data, and I'll create insights for you. 📊"
     
     # Fallback
+    logger.debug("Casual reply: fallback")
     return "I'm **Insight**, your data assistant! Ask me questions about your database, and I'll help you explore the data with smart queries and visualizations. What would you like to know?"
 
 # Updated main exploration function
-def explore_data_for_facts(question: str = "", rounds: int = 0, per_round: int = 0, database_name: str | None = None, conversation_id: str | None = None) -> dict:
+def explore_data_for_facts(question: str = "", rounds: int = 0, per_round: int = 0, database_name: str | None = None, conversation_id: str | None = None, is_casual: bool | None = None) -> dict:
     """
     Intelligent exploration: Use deep_explore_prompt for question-specific queries when a question is provided,
     otherwise fall back to passive sampling.
@@ -2065,11 +2824,17 @@ def explore_data_for_facts(question: str = "", rounds: int = 0, per_round: int =
         per_round: (deprecated) Queries per round
         database_name: Database to explore
         conversation_id: Optional conversation ID to scope facts to current conversation
+        is_casual: Classification already made by the caller; computed here when omitted
     """
     database_name = database_name or 'zigment'
     
     # If we have a meaningful question, use deep exploration
     if question and question.strip() and len(question.strip()) > 5:
+        # Small talk has nothing to explore; the classifier is memoized, so a repeat check is cheap
+        if is_casual is None:
+            is_casual = is_casual_conversation(question)
+        if is_casual:
+            return {"facts": "", "allowed": ""}
         print(f"🧠 Using intelligent deep exploration for question: '{question[:50]}...'")
         return run_deep_exploration(question, database_name, conversation_id=conversation_id)
     else:
@@ -2078,17 +2843,8 @@ def explore_data_for_facts(question: str = "", rounds: int = 0, per_round: int =
         return passive_exploration_fallback(database_name)
 
 # Chart validation prompt - decides if a chart is truly necessary
-chart_validator_prompt = ChatPromptTemplate.from_template("""
-You are a data visualization critic. Your job is to decide if a proposed chart is truly necessary or if the information would be better conveyed through text alone.
-
-**ORIGINAL QUESTION:** {question}
-**CHART PROPOSAL:**
-- Type: {chart_type}
-- Title: {title}
-- Purpose: {chart_purpose}
-- Data Preview: {data_preview}
-
-**STRICT VALIDATION CRITERIA:**
+# Shared by the single-chart and batched validator prompts
+_CHART_VALIDATION_CRITERIA = """**STRICT VALIDATION CRITERIA:**
 
 🚫 **REJECT THE CHART IF (USELESS VISUALIZATIONS):**
 1. **Single item only** - Only 1 data point (e.g., "John Smith: 5 messages" - nothing to compare)
@@ -2149,49 +2905,225 @@ You are a data visualization critic. Your job is to decide if a proposed chart i
    - Data: 5 years of time series data
    - Reason: Shows trend over time with sufficient data points
 
-**DECISION:**
-Respond with EXACTLY one of these:
-- `APPROVE: [brief reason why chart adds value]`
-- `REJECT: [brief reason why useless] | REPLACEMENT: [0-2 short sentences that state the fact naturally, no chart references]`
+"""
 
-**REPLACEMENT TEXT RULES (STRICT):**
+_CHART_REPLACEMENT_RULES = """**REPLACEMENT TEXT RULES (STRICT):**
 - Never mention: chart, graph, visual, validator, rejected, replacement, pie, bar, line, scatter
 - Just state the fact naturally: "Colombia Airlines operates 500 flights, making it the primary carrier in the region."
 - Keep it conversational and informative
 
-Your decision:
-""")
+"""
+
+chart_validator_prompt = ChatPromptTemplate.from_template(
+    """
+You are a data visualization critic. Your job is to decide if a proposed chart is truly necessary or if the information would be better conveyed through text alone.
+
+**ORIGINAL QUESTION:** {question}
+**CHART PROPOSAL:**
+- Type: {chart_type}
+- Title: {title}
+- Purpose: {chart_purpose}
+- Data Preview: {data_preview}
+
+"""
+    + _CHART_VALIDATION_CRITERIA
+    + """**DECISION:**
+Respond with EXACTLY one of these:
+- `APPROVE: [brief reason why chart adds value]`
+- `REJECT: [brief reason why useless] | REPLACEMENT: [0-2 short sentences that state the fact naturally, no chart references]`
+
+"""
+    + _CHART_REPLACEMENT_RULES
+    + """Your decision:
+"""
+)
+
+# Batched variant: the same criteria and replacement rules, applied to several charts in one call
+chart_validator_batch_prompt = ChatPromptTemplate.from_template(
+    "You are a data visualization critic. For EACH proposed chart, decide if it is truly necessary "
+    "or if the information would be better conveyed through text alone.\n\n"
+    "**ORIGINAL QUESTION:** {question}\n"
+    "**CHART PROPOSALS (JSON array; `index` identifies each chart):**\n{charts_json}\n\n"
+    + _CHART_VALIDATION_CRITERIA
+    + "**DECISION:**\n"
+    "Respond with a JSON object with one verdict per chart, in the same order:\n"
+    '{"verdicts": [{"index": 0, "approved": true, "reason": "brief reason", "replacement_text": ""}]}\n'
+    "For rejected charts, replacement_text is 0-2 short sentences that state the fact naturally.\n\n"
+    + _CHART_REPLACEMENT_RULES
+)
 
 
 
 
 # get_schema() removed - use _SCHEMA_JSON directly (JSON string) or get_hardcoded_schema() (dict)
 
+# Row counts change slowly; cache them and let concurrent callers share a single fetch
+_table_counts_cache = _TTLCache(ttl=300.0, maxsize=16)
+
 def get_table_and_column_counts(database_name: str) -> dict:
     """Return table row counts for available collections (API-based).
     
-    Note: Fetches counts by running COUNT(*) queries for each collection.
+    Results are cached for a few minutes. When the cache is cold, only one caller
+    runs the COUNT(*) queries; others wait on the same in-flight result.
+    """
+    return _table_counts_cache.get_or_fetch(
+        (database_name,),
+        lambda: _load_or_fetch_counts(database_name),
+        should_cache=lambda counts: bool(counts.get("tables")),
+    )
+
+# Counts also persist in SQLite so restarts and other workers skip the COUNT(*) fan-out
+COUNTS_CACHE_TTL = int(os.getenv("COUNTS_CACHE_TTL", "3600"))
+# Upper bound on persisted rows and how often expired/excess rows are swept
+COUNTS_CACHE_MAX_ROWS = int(os.getenv("COUNTS_CACHE_MAX_ROWS", "1000"))
+COUNTS_PURGE_INTERVAL = int(os.getenv("COUNTS_PURGE_INTERVAL", "3600"))
+
+# One long-lived connection for the counts store: connection PRAGMAs only last as long as
+# the connection, and reopening per lookup costs more than the lookup itself
+_counts_store_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def _counts_store():
+    conn = sqlite3.connect(SQLITE_PATH, check_same_thread=False)
+    conn.executescript(
+        "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA temp_store=MEMORY;"
+        " PRAGMA cache_size=-65536; PRAGMA mmap_size=268435456;"
+    )
+    return conn
+
+def load_persisted_counts(database_name: str) -> dict | None:
+    """Unexpired persisted counts for a database, or None."""
+    with _counts_store_lock:
+        row = _counts_store().execute(
+            "SELECT counts_json FROM schema_counts WHERE database_name=? AND expires_at>?",
+            (database_name, int(time.time())),
+        ).fetchone()
+    return orjson.loads(row[0]) if row else None
+
+def save_persisted_counts(database_name: str, counts: dict, ttl: int = COUNTS_CACHE_TTL):
+    with _counts_store_lock, _counts_store() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO schema_counts (database_name, counts_json, expires_at) VALUES (?, ?, ?)",
+            (database_name, _json_dumps(counts), int(time.time()) + ttl),
+        )
+
+def drop_persisted_counts(database_name: str):
+    with _counts_store_lock, _counts_store() as conn:
+        conn.execute("DELETE FROM schema_counts WHERE database_name=?", (database_name,))
+
+def purge_persisted_counts(max_rows: int = COUNTS_CACHE_MAX_ROWS) -> int:
+    """Delete expired persisted counts, then the soonest-expiring rows beyond max_rows.
+
+    Both deletes walk the expires_at index, so neither scans the whole table.
     """
+    with _counts_store_lock, _counts_store() as conn:
+        removed = conn.execute("DELETE FROM schema_counts WHERE expires_at<=?", (int(time.time()),)).rowcount
+        removed += conn.execute(
+            "DELETE FROM schema_counts WHERE database_name IN ("
+            " SELECT database_name FROM schema_counts ORDER BY expires_at"
+            " LIMIT max(0, (SELECT COUNT(*) FROM schema_counts) - ?))",
+            (max_rows,),
+        ).rowcount
+    return removed
+
+def _counts_purge_loop():
+    while True:
+        time.sleep(COUNTS_PURGE_INTERVAL)
+        try:
+            removed = purge_persisted_counts()
+            if removed:
+                print(f"🧹 Purged {removed} persisted count row(s)")
+        except Exception as e:
+            print(f"⚠️ Failed to purge persisted counts: {e}")
+
+threading.Thread(target=_counts_purge_loop, name="counts-purge", daemon=True).start()
+
+def _load_or_fetch_counts(database_name: str) -> dict:
+    try:
+        persisted = load_persisted_counts(database_name)
+        if persisted is not None:
+            return persisted
+    except Exception as e:
+        print(f"⚠️ Could not read persisted counts: {e}")
+    counts = _fetch_table_and_column_counts(database_name)
+    if counts.get("tables"):
+        try:
+            save_persisted_counts(database_name, counts)
+        except Exception as e:
+            print(f"⚠️ Could not persist counts: {e}")
+    return counts
+
+# None until the first attempt; False once the API has rejected a UNION ALL count batch
+_union_counts_supported: bool | None = None
+
+def _batch_count_collections(names: tuple[str, ...]) -> dict | None:
+    """Count every collection in one UNION ALL query.
+
+    Returns {name: count}, or None when batching is unsupported or this attempt failed, in
+    which case the caller runs the per-collection counts instead. Batching is only switched
+    off for good when the API rejects the query itself (success=false or a 4xx reply);
+    timeouts, 5xx replies and incomplete results just fall back for this call.
+    """
+    global _union_counts_supported
+    if not names or _union_counts_supported is False:
+        return None
+    query = " UNION ALL ".join(f"SELECT '{name}' AS tbl, COUNT(*) AS c FROM {name}" for name in names)
+    from requests import HTTPError
+    try:
+        result = execute_noql_query(query)
+    except HTTPError as e:
+        status = getattr(e.response, "status_code", None)
+        if status is not None and 400 <= status < 500:
+            print(f"⚠️ API rejected batched count query ({status}), using per-collection counts from now on")
+            _union_counts_supported = False
+        else:
+            print(f"⚠️ Batched count query failed, using per-collection counts: {e}")
+        return None
+    except Exception as e:
+        print(f"⚠️ Batched count query failed, using per-collection counts: {e}")
+        return None
+    if not result.get("success"):
+        print(f"⚠️ API rejected batched count query, using per-collection counts from now on: {result.get('error') or result.get('message')}")
+        _union_counts_supported = False
+        return None
+    counts = {}
+    try:
+        for row in (result.get("data") or {}).get("rows") or ():
+            tbl, count_val = (row[0], row[1]) if isinstance(row, (list, tuple)) else (row.get("tbl"), row.get("c"))
+            counts[tbl] = int(count_val) if count_val else 0
+    except Exception as e:
+        print(f"⚠️ Unexpected batched count reply, using per-collection counts: {e}")
+        return None
+    if set(counts) != set(names):
+        print("⚠️ Incomplete batched count reply, using per-collection counts")
+        return None
+    _union_counts_supported = True
+    return counts
+
+def _fetch_table_and_column_counts(database_name: str) -> dict:
+    """Fetch counts by running COUNT(*) queries for each collection."""
     try:
-        # Use hardcoded schema to get list of collections
-        schema = get_hardcoded_schema()
-        collections = schema.get("collections", [])
-        
         table_counts = {}
         
-        # Get count for each collection
-        for collection in collections[:10]:  # Limit to first 10 to avoid slowdown
-            collection_name = collection.get("name", "").upper()
-            # Use lowercase name for actual query
-            query_name = collection_name.lower().replace("_", "")
-            
+        # Use lowercase names for the actual queries; limit to first 10 to avoid slowdown
+        query_names = _COLLECTION_QUERY_NAMES[:10]
+        
+        # One UNION ALL round-trip when the API accepts it
+        batched = _batch_count_collections(query_names)
+        if batched is not None:
+            print(f"📊 Fetched counts for {len(batched)} collections (batched)")
+            return {"tables": batched, "columns": {}}
+        
+        count_queries = [f"SELECT COUNT(*) as count FROM {name}" for name in query_names]
+        
+        # Counts are independent, so run them concurrently
+        for query_name, result in zip(query_names, execute_noql_queries_parallel(count_queries)):
             try:
-                # Run COUNT query
-                count_query = f"SELECT COUNT(*) as count FROM {query_name} LIMIT 1"
-                result = execute_noql_query(count_query)
+                if isinstance(result, Exception):
+                    raise result
                 
-                if result.get("success") and result.get("data"):
-                    data = result["data"]
+                data = result.get("data") if result.get("success") else None
+                if data:
                     if isinstance(data, dict) and "rows" in data:
                         rows = data["rows"]
                         if rows and len(rows) > 0:
@@ -2227,22 +3159,28 @@ def generate_table_size_guidance(counts: dict, threshold: int = 100000) -> str:
     Returns:
         String with guidance to inject into prompts
     """
-    if not counts or "tables" not in counts:
+    tables = counts.get("tables") if counts else None
+    if not tables:
         return ""
     
-    large_tables = []
-    for table, row_count in counts["tables"].items():
-        if row_count > threshold:
-            large_tables.append(f"{table} ({row_count:,} rows)")
+    large_tables = tuple(
+        f"{table} ({row_count:,} rows)"
+        for table, row_count in tables.items()
+        if row_count > threshold
+    )
     
     if not large_tables:
         return ""
     
-    guidance = f"""
+    huge_tables = tuple(table for table, row_count in tables.items() if row_count > _OR_JOIN_SUBQUERY_ROWS)
+    return _render_table_size_guidance(large_tables, huge_tables)
+
+# Everything except the table list is fixed; joined once at module load
+_TABLE_GUIDANCE_TEMPLATE = """
 ⚠️ **LARGE TABLE WARNING - MANDATORY QUERY OPTIMIZATION:**
 
 The following tables contain substantial data:
-{chr(10).join(f"- {t}" for t in large_tables)}
+%s
 
 🚨 **CRITICAL PERFORMANCE RULES (You MUST follow these):**
 1. **ALWAYS use LIMIT clauses** - Default to LIMIT 50, max 500 for large tables
@@ -2271,16 +3209,72 @@ WITH filtered_large AS (
 SELECT ... FROM filtered_large fl JOIN small_table st ON fl.key_col = st.key_col LIMIT 50
 ```
 
+🔀 **OR-IN-JOIN RULE:** Never join with `ON a.x = b.id OR a.y = b.id`. %s
+
 💡 **GUIDELINE:** If a table has >100k rows, treat it as "expensive" and optimize aggressively.
 If a table has >1M rows, always use LIMIT even in subqueries/CTEs.
-"""
-    return guidance.strip()
+""".strip()
+
+# Above this many rows, OR-joins become separate aggregated subqueries instead of UNION ALL
+_OR_JOIN_SUBQUERY_ROWS = 10_000_000
+
+@functools.lru_cache(maxsize=64)
+def _render_table_size_guidance(large_tables: tuple[str, ...], huge_tables: tuple[str, ...] = ()) -> str:
+    """Guidance text for a given set of large tables; only the table lists vary between calls."""
+    if huge_tables:
+        or_join_rule = (
+            f"If the join touches {', '.join(huge_tables)} (over 10M rows), use separate aggregated "
+            "subqueries, one per OR branch, and combine their results; otherwise split the OR into "
+            "one join per branch combined with UNION ALL."
+        )
+    else:
+        or_join_rule = "No table here exceeds 10M rows, so split the OR into one join per branch combined with UNION ALL."
+    return _TABLE_GUIDANCE_TEMPLATE % ("\n".join(f"- {t}" for t in large_tables), or_join_rule)
+
+# Aggregate-looking column names; an empty string in one of these means 0
+_NUMERIC_COLUMN_RE = re.compile(r"count|total|sum|avg|average", re.IGNORECASE)
+
+def _convert_api_cell(val, numeric: bool):
+    """Flatten one API cell: arrays become a scalar/short string, blank aggregates become 0."""
+    if isinstance(val, list):
+        if len(val) == 1:
+            return val[0]  # Single item array -> scalar
+        if not val:
+            return None
+        return ', '.join(str(v) for v in val[:3])  # Multiple items -> comma-separated string (max 3)
+    if numeric and val == '':
+        return 0
+    return val
+
+@functools.lru_cache(maxsize=128)
+def _row_converter(columns: tuple):
+    """Compile a dict-row -> tuple converter specialized to this column list.
+
+    Column keys and their numeric-ness are baked in, so a row costs one dict lookup and
+    one type check per cell; only list and blank-aggregate cells reach _convert_api_cell.
+    """
+    lines = ["def _convert(row, _cell=_convert_api_cell, _list=list):", "    get = row.get"]
+    cells = []
+    for i, col in enumerate(columns):
+        lines.append(f"    v{i} = get({col!r})")
+        if col is not None and _NUMERIC_COLUMN_RE.search(col):
+            cells.append(f"(_cell(v{i}, True) if v{i}.__class__ is _list or v{i} == '' else v{i})")
+        else:
+            cells.append(f"(_cell(v{i}, False) if v{i}.__class__ is _list else v{i})")
+    lines.append(f"    return ({', '.join(cells)}{',' if len(cells) == 1 else ''})")
+    namespace = {"_convert_api_cell": _convert_api_cell}
+    exec(compile("\n".join(lines), f"<row converter {len(columns)} cols>", "exec"), namespace)
+    return namespace["_convert"]
+
+def run_query(query, database_name="zigment", return_columns=False, normalized=False, max_rows=None):
+    """Execute NoQL query via API, optionally returning column names
 
-def run_query(query, database_name="zigment", return_columns=False):
-    """Execute NoQL query via API, optionally returning column names"""
+    Pass normalized=True when the caller already ran the query through normalize_query.
+    With max_rows set, only that many rows are converted and returned.
+    """
     try:
         # Normalize LLM output: strip markdown fences and enforce safe LIMIT
-        cleaned_query = normalize_query(str(query), 50)
+        cleaned_query = str(query) if normalized else normalize_query(str(query), 50)
         
         # Execute via API
         result = execute_noql_query(cleaned_query)
@@ -2308,6 +3302,8 @@ def run_query(query, database_name="zigment", return_columns=False):
                 # Extract from nested structure
                 data_obj = result["data"]
                 rows = data_obj.get("rows", [])
+                if max_rows is not None and rows:
+                    rows = rows[:max_rows]
                 headers = data_obj.get("headers", [])
                 
                 # Extract column names from headers
@@ -2324,25 +3320,7 @@ def run_query(query, database_name="zigment", return_columns=False):
                 
                 # Convert list of dicts to list of tuples for compatibility
                 if rows and isinstance(rows[0], dict):
-                    # Convert each row, handling nested arrays/objects
-                    data = []
-                    for row in rows:
-                        row_values = []
-                        for col in columns:
-                            val = row.get(col)
-                            # Handle arrays: take first element or convert to string
-                            if isinstance(val, list):
-                                if len(val) == 1:
-                                    val = val[0]  # Single item array -> scalar
-                                elif len(val) == 0:
-                                    val = None
-                                else:
-                                    val = ', '.join(str(v) for v in val[:3])  # Multiple items -> comma-separated string (max 3)
-                            # Handle empty strings for numeric fields
-                            elif val == '' and any(keyword in col.lower() for keyword in ['count', 'total', 'sum', 'avg', 'average']):
-                                val = 0
-                            row_values.append(val)
-                        data.append(tuple(row_values))
+                    data = list(map(_row_converter(tuple(columns)), rows))
                 else:
                     data = rows if rows else []
                     
@@ -2358,6 +3336,8 @@ def run_query(query, database_name="zigment", return_columns=False):
                     data = []
                 if columns is None:
                     columns = []
+                if max_rows is not None and isinstance(data, list):
+                    data = data[:max_rows]
                 
                 # If data is a list of dicts, extract column names from first row
                 if data and isinstance(data, list) and len(data) > 0:
@@ -2388,6 +3368,14 @@ def run_query(query, database_name="zigment", return_columns=False):
         else:
             return [], []
 
+# Topics that can't be answered from CRM data. Only the start of a word is anchored, so
+# plurals ("movies", "songs") still match.
+_IRRELEVANT_RE = re.compile(
+    r"\b(?:how to cook|recipe|weather|news|sports score|stock price|cryptocurrency|bitcoin|movie|song"
+    r"|book recommendation|travel advice|medical advice)",
+    re.IGNORECASE,
+)
+
 def check_question_relevance(question: str, database_name: str) -> dict:
     """Check if the question is relevant to the database schema"""
     if not question or len(question.strip()) < 3:
@@ -2413,23 +3401,13 @@ def check_question_relevance(question: str, database_name: str) -> dict:
             "suggestion": "Please check if the database is properly configured"
         }
     
-    # Basic relevance checks
-    question_lower = question.lower()
-    
     # Check for obviously irrelevant questions
-    irrelevant_patterns = [
-        "how to cook", "recipe", "weather", "news", "sports score",
-        "stock price", "cryptocurrency", "bitcoin", "movie", "song",
-        "book recommendation", "travel advice", "medical advice"
-    ]
-    
-    for pattern in irrelevant_patterns:
-        if pattern in question_lower:
-            return {
-                "relevant": False,
-                "error": "Question appears to be unrelated to database content",
-                "suggestion": "Please ask questions about the data in this database"
-            }
+    if _IRRELEVANT_RE.search(question):
+        return {
+            "relevant": False,
+            "error": "Question appears to be unrelated to database content",
+            "suggestion": "Please ask questions about the data in this database"
+        }
     
     return {
         "relevant": True,
@@ -2460,6 +3438,16 @@ def create_no_data_response(question: str) -> dict:
     }
 
 # Shared query execution helper
+def _has_meaningful_row(rows) -> bool:
+    """True once any row has a non-null, non-blank cell; stops at the first such row.
+
+    Only strings are stripped; any other non-None value (including 0 and False) counts.
+    """
+    return any(
+        any(cell.strip() if isinstance(cell, str) else cell is not None for cell in row)
+        for row in rows
+    )
+
 def execute_noql_question(question: str, database_name: str, output_format: str = "table", debug: bool = False) -> dict:
     """
     Shared function to execute a NoQL query for a question.
@@ -2516,6 +3504,13 @@ def execute_noql_question(question: str, database_name: str, output_format: str
                 "Try a different question or check if the data exists"
             )
         
+        # All-empty results (e.g. NULL aggregates) go straight to the no-data reply; the
+        # scan stops at the first row with a real value
+        if not _has_meaningful_row(rows):
+            if debug:
+                print("❌ Query returned only empty rows")
+            return create_no_data_response(question)
+        
         if debug:
             print(f"📋 Query Columns: {columns}")
             print(f"📊 Query Result Rows: {len(rows) if rows else 0}")
@@ -2569,31 +3564,59 @@ def execute_noql_question(question: str, database_name: str, output_format: str
 
 # ===== Any-DB dynamic introspection and universal prompt =====
 
+_table_samples_cache = _TTLCache(ttl=180.0, maxsize=32)
+
 def sample_database_tables(database_name: str, max_rows: int = 3, max_tables: int = 10) -> dict:
-    """Return a small sample from each collection (API-based).
-    
-    Note: Fetches sample rows by running SELECT * LIMIT queries for each collection.
+    """Return a small sample from each collection (API-based), cached for a few minutes."""
+    return _table_samples_cache.get_or_fetch(
+        (database_name, max_rows, max_tables),
+        lambda: _fetch_table_samples(database_name, max_rows, max_tables),
+        should_cache=lambda samples: any(samples.values()),
+    )
+
+def _columnar_samples(samples: dict) -> dict:
+    """Re-shape {table: [row dicts]} as {table: {"columns": [...], "rows": [[...]]}} for prompts.
+
+    Column names appear once per table instead of once per row, which keeps the encoded
+    JSON (and its token count) small. Tables whose rows are not dicts pass through as-is.
     """
+    shaped = {}
+    for table, rows in samples.items():
+        if not rows or not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            shaped[table] = rows
+            continue
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        shaped[table] = {"columns": columns, "rows": [[row.get(c) for c in columns] for row in rows]}
+    return shaped
+
+# Serialized samples as they go into the chat prompt, so each question skips re-encoding them
+_samples_text_cache = _TTLCache(ttl=180.0, maxsize=32)
+
+def get_samples_text(database_name: str, limit: int = 4000) -> str:
+    """Columnar JSON of sample_database_tables(database_name), cut at `limit` characters."""
+    return _samples_text_cache.get_or_fetch(
+        (database_name, limit),
+        lambda: _json_head(_columnar_samples(sample_database_tables(database_name)), limit),
+        # Only keep the text while the samples it came from are cached
+        should_cache=lambda text: _table_samples_cache.get((database_name, 3, 10)) is not _TTLCache._MISS,
+    )
+
+def _fetch_table_samples(database_name: str, max_rows: int, max_tables: int) -> dict:
+    """Fetch sample rows by running SELECT * LIMIT queries for each collection."""
     try:
-        # Use hardcoded schema to get list of collections
-        schema = get_hardcoded_schema()
-        collections = schema.get("collections", [])
-        
         samples = {}
         
-        # Get sample for each collection
-        for collection in collections[:max_tables]:
-            collection_name = collection.get("name", "").upper()
-            # Use lowercase name for actual query
-            query_name = collection_name.lower().replace("_", "")
-            
+        # Use lowercase names for the actual queries; samples are independent, so run them concurrently
+        query_names = _COLLECTION_QUERY_NAMES[:max_tables]
+        sample_queries = [f"SELECT * FROM {name} LIMIT {max_rows}" for name in query_names]
+        
+        for query_name, result in zip(query_names, execute_noql_queries_parallel(sample_queries)):
             try:
-                # Run sample query
-                sample_query = f"SELECT * FROM {query_name} LIMIT {max_rows}"
-                result = execute_noql_query(sample_query)
+                if isinstance(result, Exception):
+                    raise result
                 
-                if result.get("success") and result.get("data"):
-                    data = result["data"]
+                data = result.get("data") if result.get("success") else None
+                if data:
                     if isinstance(data, dict) and "rows" in data:
                         rows = data["rows"]
                         if rows:
@@ -2854,19 +3877,28 @@ QUESTION: {question}
 """
 )
 
-def create_anydb_sql_chain(database_name: str):
-    """Generate NoQL query from question using LLM"""
-    schema_str = _SCHEMA_JSON
-    llm = ChatOpenAI(model_name="gpt-3.5-turbo")
+class NoQLChain:
+    """Generates a NoQL query for a question; holds only the prebuilt system message."""
     
-    class NoQLChain:
-        def invoke(self, payload):
-            question = payload["question"]
-            formatted_prompt = NOQL_DIRECT_PROMPT.format(schema=schema_str, question=question)
-            result = llm.invoke(formatted_prompt)
-            return result.text.strip()
+    def __init__(self, system_message: dict):
+        self.system_message = system_message
     
-    return NoQLChain()
+    def invoke(self, payload):
+        question_message = {"role": "user", "content": f"# USER QUESTION:\n{payload['question']}"}
+        result = noql_llm.invoke([self.system_message, question_message])
+        return result.text.strip()
+
+@functools.lru_cache(maxsize=32)
+def _noql_chain(database_name: str, schema_fingerprint: str) -> NoQLChain:
+    return NoQLChain(_noql_system_message(database_name, schema_fingerprint))
+
+def create_anydb_sql_chain(database_name: str):
+    """Generate NoQL query from question using LLM.
+
+    The chain is stateless, so one instance per (database, schema fingerprint) is shared by
+    every question and chart; a schema change yields a new fingerprint and a new chain.
+    """
+    return _noql_chain(database_name, _SCHEMA_FINGERPRINT)
 
 def answer_anydb_question(question: str, database_name: str):
     """Answer question and return table-formatted data"""
@@ -3883,6 +4915,27 @@ Follow these strict rules when generating SQL:
    - Ensure JOIN columns would benefit from indexes in production
    - Consider using CTEs to break down complex multi-table joins
    
+   **LIMIT Pushdown Rules:**
+   - LEFT JOIN + LIMIT k: every left row survives the join, so apply LIMIT k to the left side first
+     and join only those k rows instead of joining everything and trimming at the end
+   ```sql
+   -- ❌ SLOW: joins every contact, then keeps 10
+   SELECT c.full_name, ch.channel FROM contacts c
+   LEFT JOIN chathistories ch ON ch.contact_id = c._id
+   LIMIT 10;
+   
+   -- ✅ FAST: picks 10 contacts, then joins only those
+   SELECT c.full_name, ch.channel
+   FROM (SELECT _id, full_name FROM contacts WHERE is_deleted = false LIMIT 10) c
+   LEFT JOIN chathistories ch ON ch.contact_id = c._id
+   LIMIT 10;
+   ```
+   - INNER JOIN + LIMIT k: rows can drop out of the join, so do NOT limit either side early;
+     keep the LIMIT at the outer level
+   - ORDER BY blocks pushdown: if the ORDER BY uses a column from the right side (or an aggregate
+     over the join), the full join must run first; only push the LIMIT down when the ORDER BY uses
+     left-side columns alone, and repeat the same ORDER BY inside the limited subquery
+   
    **WHERE Clause Optimization:**
    - Avoid functions on columns in WHERE (use date ranges instead of YEAR(date) = 2023)
    - Use efficient operators: = is faster than LIKE, specific ranges faster than functions
@@ -3982,6 +5035,28 @@ Follow these strict rules when generating SQL:
    WHERE f.total > 1000;
    ```
    
+   **LIMIT inside CTEs:**
+   - When the outer query keeps only the top N rows by a value the CTE computes, put the same
+     ORDER BY and LIMIT inside the CTE so only those rows are materialized, not the full aggregate
+   - Safe only when: the outer ORDER BY uses the CTE's own column, the outer query does not
+     aggregate over the CTE again, and each CTE row joins to exactly one row (e.g. to its primary key)
+   ```sql
+   -- ✅ Top 10 customers: the CTE stops at its top 10 instead of aggregating every customer into the join
+   WITH filtered_data AS (
+     SELECT customer_id, SUM(amount) AS total
+     FROM orders
+     WHERE order_date >= '2023-01-01'
+     GROUP BY customer_id
+     ORDER BY total DESC
+     LIMIT 10
+   )
+   SELECT c.name, f.total
+   FROM filtered_data f
+   JOIN customers c ON c.id = f.customer_id
+   ORDER BY f.total DESC
+   LIMIT 10;
+   ```
+   
    🧮 **Statistical and Mathematical Analysis:**
    - Use STDDEV(), VARIANCE() for statistical measures
    - Calculate percentiles and quartiles with window functions
@@ -4131,14 +5206,31 @@ Follow these strict rules when generating SQL:
    FROM category_metrics
    QUALIFY overall_rank <= 10;  -- PostgreSQL/SQL Server QUALIFY clause
    
-   -- ✅ MYSQL Alternative (no QUALIFY support):
+   -- ❌ AVOID: ranking the whole table just to keep the first 10 (sorts every row)
    WITH ranked_categories AS (
      SELECT category_name, item_count, average_value,
             ROW_NUMBER() OVER (ORDER BY item_count DESC, average_value DESC) AS rn
      FROM category_metrics
    )
    SELECT category_name, item_count, average_value FROM ranked_categories WHERE rn <= 10;
+   
+   -- ✅ TOP-N, NO PARTITION: ORDER BY + LIMIT keeps only the best 10 while scanning
+   SELECT category_name, item_count, average_value
+   FROM category_metrics
+   ORDER BY item_count DESC, average_value DESC
+   LIMIT 10;
+   
+   -- ✅ TOP-N PER GROUP: keep ROW_NUMBER() only when there is a PARTITION BY key
+   SELECT region, category_name, item_count
+   FROM (
+     SELECT region, category_name, item_count,
+            ROW_NUMBER() OVER (PARTITION BY region ORDER BY item_count DESC) AS rn
+     FROM category_metrics
+   ) ranked
+   WHERE rn <= 10;
    ```
+   - Rule: an outer filter `rn <= k` on a ROW_NUMBER() with no PARTITION BY must be written as
+     `ORDER BY ... LIMIT k` instead; use ROW_NUMBER()/RANK() for top-N only when partitioned
    
    **4. Join Elimination and Early Filtering:**
    ```sql
@@ -4683,21 +5775,11 @@ def safe_float(value):
 
 
 
-def select_best_axis_column(columns, axis_type="x"):
-    """Intelligently select the best column for specified axis using LLM"""
-    if not columns:
-        return "category" if axis_type == "x" else "value"
-    
-    if len(columns) == 1:
-        return columns[0]
-    
-    try:
-        # Create LLM prompt for intelligent column selection
-        axis_prompt = ChatPromptTemplate.from_template("""
-You are a data visualization expert. Select the best column for the {axis_type} axis from the given columns.
+# One LLM call picks both axes; format_data_for_chart_type needs x and y for every chart
+axis_columns_prompt = ChatPromptTemplate.from_template("""
+You are a data visualization expert. Select the best columns for the X axis and the Y axis from the given columns.
 
 **Available columns:** {columns}
-**Axis type:** {axis_type} axis
 **Context:** Chart data visualization
 
 **Selection criteria:**
@@ -4708,44 +5790,52 @@ You are a data visualization expert. Select the best column for the {axis_type}
 - Consider data type and content relevance
 
 **Rules:**
-1. Return ONLY the column name (exact match from the list)
-2. No explanations or additional text
-3. If uncertain, choose the most descriptive/relevant column
-4. Ensure the column exists in the provided list
+1. Return ONLY a JSON object of the form {"x": "<column>", "y": "<column>"}
+2. Column names must match the list exactly
+3. No explanations or additional text
+4. If uncertain, choose the most descriptive/relevant column
 
 **Example:**
 Columns: ['id', 'name', 'count', 'date']
-X-axis: 'name'
-Y-axis: 'count'
+{"x": "name", "y": "count"}
 """)
-        
-        chain = axis_prompt | llm | StrOutputParser()
-        selected_column = chain.invoke({
-            "columns": ", ".join(columns),
-            "axis_type": axis_type
-        }).strip()
-        
-        # Validate the LLM response
-        if selected_column in columns:
-            return selected_column
-        
-        # Fallback to simple logic if LLM response is invalid
-        if axis_type == "x":
-            # For X-axis, prefer non-ID columns
-            non_id_columns = [col for col in columns if not is_id_column(col)]
-            return non_id_columns[0] if non_id_columns else columns[0]
-        else:
-            # For Y-axis, prefer last column (usually aggregated)
-            return columns[-1]
-            
+_AXIS_COLUMNS_CHAIN = axis_columns_prompt | llm.bind(response_format=_JSON_MODE) | StrOutputParser()
+
+def _fallback_axis_column(columns, axis_type):
+    if axis_type == "x":
+        # For X-axis, prefer non-ID columns
+        non_id_columns = [col for col in columns if not is_id_column(col)]
+        return non_id_columns[0] if non_id_columns else columns[0]
+    # For Y-axis, prefer last column (usually aggregated)
+    return columns[-1]
+
+@functools.lru_cache(maxsize=512)
+def _llm_axis_columns(columns: tuple[str, ...]) -> tuple[str | None, str | None]:
+    """Ask the LLM for (x, y) in a single call; memoized per column tuple. Raises on failure."""
+    selected = orjson.loads(_AXIS_COLUMNS_CHAIN.invoke({"columns": ", ".join(columns)}))
+    x_col, y_col = selected.get("x"), selected.get("y")
+    # Validate the LLM response; invalid picks fall back per axis
+    return (x_col if x_col in columns else None), (y_col if y_col in columns else None)
+
+def select_axis_columns(columns) -> tuple[str, str]:
+    """Intelligently select the best (x, y) columns using one LLM call"""
+    if not columns:
+        return "category", "value"
+    
+    if len(columns) == 1:
+        return columns[0], columns[0]
+    
+    try:
+        x_col, y_col = _llm_axis_columns(tuple(columns))
     except Exception as e:
         print(f"⚠️ LLM column selection failed: {e}")
-        # Fallback to simple logic
-        if axis_type == "x":
-            non_id_columns = [col for col in columns if not is_id_column(col)]
-            return non_id_columns[0] if non_id_columns else columns[0]
-        else:
-            return columns[-1]
+        x_col = y_col = None
+    return x_col or _fallback_axis_column(columns, "x"), y_col or _fallback_axis_column(columns, "y")
+
+def select_best_axis_column(columns, axis_type="x"):
+    """Intelligently select the best column for specified axis using LLM"""
+    x_col, y_col = select_axis_columns(columns)
+    return x_col if axis_type == "x" else y_col
 
 def is_id_column(column_name):
     """Check if a column is likely an ID field"""
@@ -4765,6 +5855,19 @@ def get_best_column_index(columns, axis_type="x"):
     except ValueError:
         return 0 if axis_type == "x" else -1  # Fallback
 
+def get_best_column_indexes(columns):
+    """Get the (x, y) column indexes to use, with a single column-selection call"""
+    if not columns:
+        return 0, -1
+    
+    x_col, y_col = select_axis_columns(columns)
+    x_idx = columns.index(x_col) if x_col in columns else 0
+    y_idx = columns.index(y_col) if y_col in columns else -1
+    return x_idx, y_idx
+
+# Optional table alias (a., b.) followed by an optional CTE/subquery prefix (FC., CT.), in one pass
+_COLUMN_PREFIX_RE = re.compile(r'^(?:[a-zA-Z]{1,3}\.)?(?:[A-Z]{2,}\.)?')
+
 def generate_axis_labels(chart_type, columns, question, title):
     """Generate intelligent axis labels based on context (optimized - skip LLM if enabled)"""
     SKIP_LLM_LABELS = os.getenv("SKIP_LLM_AXIS_LABELS", "true").lower() == "true"
@@ -4773,13 +5876,10 @@ def generate_axis_labels(chart_type, columns, question, title):
         return "Categories", "Values"
     
     # Clean column names - remove SQL aliases and technical prefixes
-    import re
     clean_columns = []
     for col in columns:
-        # Remove table aliases (a., b., c., etc.) - both lowercase and uppercase
-        cleaned = re.sub(r'^[a-zA-Z]{1,3}\.', '', col)
-        # Remove common CTE/subquery prefixes (fc., ct., etc.)
-        cleaned = re.sub(r'^[A-Z]{2,}\.', '', cleaned)
+        # Remove a table alias (a., b., c., etc.) and then a CTE/subquery prefix (FC., CT., etc.)
+        cleaned = _COLUMN_PREFIX_RE.sub('', col, count=1)
         # Remove underscores and convert to title case for display
         cleaned = cleaned.replace('_', ' ').title()
         clean_columns.append(cleaned)
@@ -4823,8 +5923,7 @@ def generate_axis_labels(chart_type, columns, question, title):
         return x_axis, y_axis
     
     # For other chart types, intelligently select X and Y columns
-    x_col = select_best_axis_column(clean_columns, "x")
-    y_col = select_best_axis_column(clean_columns, "y")
+    x_col, y_col = select_axis_columns(clean_columns)
     
     # Generate meaningful axis labels based on column names and context
     x_axis = generate_readable_label(x_col, "x", question)
@@ -4843,14 +5942,8 @@ def generate_axis_labels(chart_type, columns, question, title):
     
     return x_axis, y_axis
 
-def generate_readable_label(column_name, axis_type, question):
-    """Convert database column names to readable labels using LLM for intelligent context-aware labeling"""
-    if not column_name:
-        return "Categories" if axis_type == "x" else "Values"
-    
-    try:
-        # Create prompt for LLM to generate human-readable label
-        label_prompt = ChatPromptTemplate.from_template("""
+# Prompt for turning column names into human-readable axis labels
+label_prompt = ChatPromptTemplate.from_template("""
 You are a data visualization expert. Convert technical database column names into clear, professional chart labels.
 
 **Column Name:** {column_name}
@@ -4875,8 +5968,15 @@ You are a data visualization expert. Convert technical database column names int
 
 Return ONLY the label text, no explanations.
 """)
-        
-        chain = label_prompt | llm | StrOutputParser()
+_LABEL_CHAIN = label_prompt | llm | StrOutputParser()
+
+def generate_readable_label(column_name, axis_type, question):
+    """Convert database column names to readable labels using LLM for intelligent context-aware labeling"""
+    if not column_name:
+        return "Categories" if axis_type == "x" else "Values"
+    
+    try:
+        chain = _LABEL_CHAIN
         readable_label = chain.invoke({
             "column_name": column_name,
             "question": question,
@@ -4895,47 +5995,94 @@ Return ONLY the label text, no explanations.
 # -------- Text-first: Markdown with embedded chart directives --------
 import re
 
+# Fenced ```chart blocks; group 1 is the JSON config between the fences
 chart_block_regex = re.compile(r"```chart\s*([\s\S]*?)```", re.IGNORECASE)
 
 def parse_chart_block(block_text: str) -> dict:
     try:
-        cfg = json.loads(block_text.strip())
+        cfg = orjson.loads(block_text.strip())
         return cfg if isinstance(cfg, dict) else {}
     except Exception:
         return {}
 
+_COMPARISON_RE = re.compile(r"\b(?:compare|comparison|vs|versus)\b", re.IGNORECASE)
+
+def validate_chart_rule_based(chart_type: str, title: str, data: list, question: str) -> tuple[str, str] | None:
+    """Apply the validator prompt's mechanical rules to the chart data.
+
+    Returns ("APPROVE", reason) or ("REJECT", replacement_text), or None when the
+    rules don't settle it and the LLM validator should decide.
+    """
+    points = [item for item in (data or []) if isinstance(item, dict)]
+    if not points:
+        return "REJECT", f"There wasn't enough data to show {title or 'this'} yet."
+    if len(points) == 1 and chart_type in ("bar", "horizontal_bar", "pie"):
+        # Nothing to compare; a one-row table is still legitimate detail
+        only = points[0]
+        label = only.get("label", "The only result")
+        value = only.get("value", only.get("y", "N/A"))
+        lead = "There is only one entry to compare" if _COMPARISON_RE.search(question or "") else "There is a single result"
+        return "REJECT", f"{lead}: {label} with {value}."
+    if chart_type == "pie" and len(points) > 10:
+        return "REJECT", f"{title or 'This breakdown'} has {len(points)} categories, which is too many to read as a pie chart."
+    if chart_type == "scatter":
+        numeric = all(isinstance(p.get("x"), (int, float)) and isinstance(p.get("y"), (int, float)) for p in points)
+        if not numeric:
+            return "REJECT", f"{title or 'This data'} isn't numeric on both axes, so a scatter plot doesn't fit."
+        return ("APPROVE", "Enough numeric points to show a relationship") if len(points) >= 3 else None
+    if chart_type == "line":
+        # Two points may be a short trend or two categories; leave that call to the LLM
+        return ("APPROVE", "Enough points to show a trend") if len(points) >= 3 else None
+    if chart_type in ("bar", "horizontal_bar", "pie", "table"):
+        return "APPROVE", f"{len(points)} data points to compare"
+    return None
+
+# What each chart type is for, as described to the validator
+_CHART_PURPOSES = {
+    "bar": "Show ranking/comparison between categories",
+    "pie": "Show proportional distribution of parts to whole",
+    "line": "Show trend or change over time",
+    "scatter": "Show correlation between two numeric variables",
+    "table": "Show detailed data with multiple attributes"
+}
+
+def _chart_data_preview(chart_data: dict) -> str:
+    """Short text preview of a chart's first few data points for the validator prompt."""
+    if not chart_data.get("data"):
+        return ""
+    data_items = chart_data["data"][:5]  # Show first 5 items
+    total_items = len(chart_data['data'])
+    entries = ", ".join(
+        f'{item.get("label", "Unknown")}: {item.get("value", item.get("x", item.get("y", "N/A")))}'
+        for item in data_items
+        if isinstance(item, dict)
+    )
+    data_preview = f"Sample data ({total_items} total items): {entries}".rstrip(", ")
+    
+    # Add explicit warning for single data point
+    if total_items == 1:
+        data_preview += " ⚠️ SINGLE DATA POINT - NO COMPARISON POSSIBLE"
+    return data_preview
+
 def validate_chart_necessity(question: str, chart_data: dict) -> dict:
     """
     Validate if a chart is truly necessary or if text would be better.
     Returns either the approved chart or replacement text.
     """
     try:
-        # Prepare data preview for validation
-        data_preview = ""
-        if chart_data.get("data"):
-            data_items = chart_data["data"][:5]  # Show first 5 items
-            total_items = len(chart_data['data'])
-            data_preview = f"Sample data ({total_items} total items): "
-            for item in data_items:
-                if isinstance(item, dict):
-                    label = item.get("label", "Unknown")
-                    value = item.get("value", item.get("x", item.get("y", "N/A")))
-                    data_preview += f"{label}: {value}, "
-            data_preview = data_preview.rstrip(", ")
-            
-            # Add explicit warning for single data point
-            if total_items == 1:
-                data_preview += " ⚠️ SINGLE DATA POINT - NO COMPARISON POSSIBLE"
+        data_preview = _chart_data_preview(chart_data)
+        chart_purpose = _CHART_PURPOSES.get(chart_data.get("chart_type", ""), "Display data visualization")
         
-        # Generate chart purpose based on chart type
-        chart_purpose_map = {
-            "bar": "Show ranking/comparison between categories",
-            "pie": "Show proportional distribution of parts to whole",
-            "line": "Show trend or change over time",
-            "scatter": "Show correlation between two numeric variables",
-            "table": "Show detailed data with multiple attributes"
-        }
-        chart_purpose = chart_purpose_map.get(chart_data.get("chart_type", ""), "Display data visualization")
+        # Clear-cut cases (empty, single point, oversized pie, ...) don't need the LLM
+        verdict = validate_chart_rule_based(
+            chart_data.get("chart_type", ""), chart_data.get("title", ""), chart_data.get("data"), question
+        )
+        if verdict is not None:
+            decision, text = verdict
+            print(f"📋 Rule-based chart validation: {decision}: {text}")
+            if decision == "APPROVE":
+                return {"approved": True, "chart": chart_data, "reason": text}
+            return {"approved": False, "reason": "Rule-based rejection", "replacement_text": text}
         
         # Run validation
         chain = chart_validator_prompt | llm | StrOutputParser()
@@ -4983,21 +6130,82 @@ def validate_chart_necessity(question: str, chart_data: dict) -> dict:
         # On error, approve the chart (fail-safe)
         return {"approved": True, "chart": chart_data, "reason": "Validation error, defaulting to approval"}
 
+_CHART_VALIDATOR_BATCH_CHAIN = chart_validator_batch_prompt | llm.bind(response_format=_JSON_MODE) | StrOutputParser()
+
+def validate_charts_necessity(question: str, chart_data_list: list[dict]) -> list[dict]:
+    """Validate several charts at once; results line up with `chart_data_list`.
+
+    Rule-based verdicts are applied first. The charts the rules leave open share a single
+    LLM call; any chart the batched reply doesn't cover falls back to validate_chart_necessity.
+    """
+    results: list[dict | None] = [None] * len(chart_data_list)
+    undecided = []
+    for i, chart_data in enumerate(chart_data_list):
+        verdict = validate_chart_rule_based(
+            chart_data.get("chart_type", ""), chart_data.get("title", ""), chart_data.get("data"), question
+        )
+        if verdict is None:
+            undecided.append(i)
+        elif verdict[0] == "APPROVE":
+            results[i] = {"approved": True, "chart": chart_data, "reason": verdict[1]}
+        else:
+            results[i] = {"approved": False, "reason": "Rule-based rejection", "replacement_text": verdict[1]}
+    
+    if len(undecided) > 1:
+        proposals = [
+            {
+                "index": i,
+                "type": chart_data_list[i].get("chart_type", "unknown"),
+                "title": chart_data_list[i].get("title", "Untitled"),
+                "purpose": _CHART_PURPOSES.get(chart_data_list[i].get("chart_type", ""), "Display data visualization"),
+                "data_preview": _chart_data_preview(chart_data_list[i]),
+            }
+            for i in undecided
+        ]
+        try:
+            response = _CHART_VALIDATOR_BATCH_CHAIN.invoke({"question": question, "charts_json": _json_dumps(proposals)})
+            print(f"📋 Batched chart validation response: {response}")
+            for verdict in orjson.loads(response).get("verdicts", []):
+                i = verdict.get("index")
+                if i in undecided and results[i] is None:
+                    if verdict.get("approved"):
+                        results[i] = {"approved": True, "chart": chart_data_list[i], "reason": verdict.get("reason", "")}
+                    else:
+                        results[i] = {
+                            "approved": False,
+                            "reason": verdict.get("reason", ""),
+                            "replacement_text": verdict.get("replacement_text")
+                            or f"Based on the data analysis, {chart_data_list[i].get('title', 'the information')} can be summarized effectively in text form.",
+                        }
+        except Exception as e:
+            print(f"⚠️ Batched chart validation failed, validating charts one by one: {e}")
+    
+    return [
+        result if result is not None else validate_chart_necessity(question, chart_data_list[i])
+        for i, result in enumerate(results)
+    ]
+
+# Chart builds run on their own pool so they never wait behind _NOQL_POOL fan-outs
+_CHART_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chart")
+
 def extract_charts_from_markdown(markdown: str, database_name: str, actual_question: str = None) -> dict:
     """Extract chart blocks from markdown and generate actual chart data"""
-    import re
     import uuid
     
-    # Find all chart blocks in markdown - more flexible pattern
-    chart_pattern = r'```chart\s*([\s\S]*?)```'
-    chart_blocks = re.findall(chart_pattern, markdown, re.DOTALL | re.IGNORECASE)
+    # Find all chart blocks in markdown; spans are kept so the markdown is rebuilt in one pass
+    chart_matches = list(chart_block_regex.finditer(markdown))
     
-    print(f"🔍 Found {len(chart_blocks)} potential chart blocks in markdown")
+    print(f"🔍 Found {len(chart_matches)} potential chart blocks in markdown")
     
     charts = []
-    modified_markdown = markdown
+    # Block index -> text that replaces the whole ```chart block (placeholder, or '' to drop it)
+    replacements = {}
     
-    for idx, block in enumerate(chart_blocks):
+    # Parse every block first, then build the charts concurrently; each build is an
+    # independent LLM call plus NoQL query, so wall time is roughly that of the slowest one
+    pending = []
+    for idx, match in enumerate(chart_matches):
+        block = match.group(1)
         try:
             # Clean up the block text
             block_text = block.strip()
@@ -5010,7 +6218,7 @@ def extract_charts_from_markdown(markdown: str, database_name: str, actual_quest
             print(f"   Raw: {block_text[:200]}...")  # Show first 200 chars
             
             # Parse the JSON config
-            chart_cfg = json.loads(block_text)
+            chart_cfg = orjson.loads(block_text)
             
             # Ensure 'db' field is set if missing
             if 'db' not in chart_cfg:
@@ -5018,7 +6226,21 @@ def extract_charts_from_markdown(markdown: str, database_name: str, actual_quest
                 print(f"   ℹ️ Added missing 'db' field: {database_name}")
             
             # Build the actual chart
-            chart_data = build_chart_from_cfg(chart_cfg, database_name, actual_question)
+            pending.append((idx, _CHART_POOL.submit(build_chart_from_cfg, chart_cfg, database_name, actual_question)))
+        except json.JSONDecodeError as e:
+            print(f"   ❌ JSON parsing error for chart block {idx + 1}: {e}")
+            print(f"   📄 Block content: {block[:500]}")  # Show more of the block for debugging
+            # Remove malformed chart blocks from markdown
+            replacements[idx] = ''
+            continue
+        except Exception as e:
+            print(f"   ❌ Error processing chart block {idx + 1}: {e}")
+            replacements[idx] = ''
+            continue
+
+    for idx, future in pending:
+        try:
+            chart_data = future.result()
             
             # Only add charts that have data
             if chart_data.get("data") and len(chart_data["data"]) > 0:
@@ -5029,31 +6251,31 @@ def extract_charts_from_markdown(markdown: str, database_name: str, actual_quest
                 print(f"   ✅ Chart added: {chart_data.get('title', 'Unknown')} [ID: {chart_id}]")
                 
                 # Replace the ```chart block with a placeholder {{chart:id}}
-                original_block = f"```chart\s*{re.escape(block)}\s*```"
                 placeholder = f"{{{{chart:{chart_id}}}}}"
-                modified_markdown = re.sub(original_block, placeholder, modified_markdown, count=1, flags=re.DOTALL | re.IGNORECASE)
+                replacements[idx] = placeholder
                 print(f"   🔄 Replaced chart block with placeholder: {placeholder}")
             else:
                 print(f"   ⚠️ Skipping empty chart: {chart_data.get('title', 'Unknown')}")
                 # Remove empty chart blocks from markdown
-                original_block = f"```chart\s*{re.escape(block)}\s*```"
-                modified_markdown = re.sub(original_block, '', modified_markdown, count=1, flags=re.DOTALL | re.IGNORECASE)
-        except json.JSONDecodeError as e:
-            print(f"   ❌ JSON parsing error for chart block {idx + 1}: {e}")
-            print(f"   📄 Block content: {block[:500]}")  # Show more of the block for debugging
-            # Remove malformed chart blocks from markdown
-            original_block = f"```chart\s*{re.escape(block)}\s*```"
-            modified_markdown = re.sub(original_block, '', modified_markdown, count=1, flags=re.DOTALL | re.IGNORECASE)
-            continue
+                replacements[idx] = ''
         except Exception as e:
             print(f"   ❌ Error processing chart block {idx + 1}: {e}")
             import traceback
             traceback.print_exc()
             # Remove error chart blocks from markdown
-            original_block = f"```chart\s*{re.escape(block)}\s*```"
-            modified_markdown = re.sub(original_block, '', modified_markdown, count=1, flags=re.DOTALL | re.IGNORECASE)
+            replacements[idx] = ''
             continue
     
+    # Splice placeholders/removals into the markdown in a single pass over the block spans
+    pieces = []
+    last = 0
+    for idx, match in enumerate(chart_matches):
+        pieces.append(markdown[last:match.start()])
+        pieces.append(replacements.get(idx, match.group(0)))
+        last = match.end()
+    pieces.append(markdown[last:])
+    modified_markdown = "".join(pieces)
+    
     print(f"📊 Successfully extracted {len(charts)} charts")
     print(f"📝 Modified markdown with placeholders")
     
@@ -5143,14 +6365,15 @@ def generate_chat_response(question: str, database_name: str, conversation_id: s
         facts_text = exploration.get("facts", "(no precomputed facts)")
         allowed_text = exploration.get("allowed", "(none)")
 
-        chain = chat_markdown_prompt | llm | StrOutputParser()
+        chain = _CHAT_MARKDOWN_CHAIN
         response = chain.invoke({
             "question": question,
             "database_name": database_name,
             "schema": _SCHEMA_JSON,
-            "samples": safe_json_dumps(sample_database_tables(database_name), ensure_ascii=False)[:4000],
+            "samples": get_samples_text(database_name),
             "facts": facts_text,
             "allowed_entities": allowed_text,
+            "style_examples": select_style_examples(question),
             "history": ""  # default empty; filled by caller when available
         })
         return {
@@ -5187,6 +6410,10 @@ def convert_day_number_to_name(day_num):
     except (ValueError, TypeError):
         return str(day_num)
 
+# Substring alternations for is_day_of_week_column (column name, then question)
+_DOW_COLUMN_RE = re.compile(r"dow|day_of_week|dayofweek|weekday|day_week")
+_DOW_QUESTION_RE = re.compile(r"day of week|day of the week|per day|by day")
+
 def is_day_of_week_column(column_name, question):
     """Check if a column represents day of week"""
     if not column_name or not question:
@@ -5195,18 +6422,23 @@ def is_day_of_week_column(column_name, question):
     q_lower = str(question).lower()
     
     # Check if column name suggests day of week
-    day_indicators = ['dow', 'day_of_week', 'dayofweek', 'weekday', 'day_week']
-    if any(indicator in col_lower for indicator in day_indicators):
+    if _DOW_COLUMN_RE.search(col_lower):
         return True
     
     # Check if question mentions day of week
-    question_indicators = ['day of week', 'day of the week', 'per day', 'by day']
-    if any(indicator in q_lower for indicator in question_indicators):
+    if _DOW_QUESTION_RE.search(q_lower):
         return True
     
     return False
 
 # Helper function to format data for specific chart types
+def _is_number(v):
+    try:
+        float(str(v))
+        return True
+    except Exception:
+        return False
+
 def format_data_for_chart_type(data, chart_type, question, columns=None):
     """
     Format data appropriately for different chart types.
@@ -5276,8 +6508,7 @@ def format_data_for_chart_type(data, chart_type, question, columns=None):
         
         # Determine which columns to use for label and value
         if columns:
-            label_col_idx = get_best_column_index(columns, "x")
-            value_col_idx = get_best_column_index(columns, "y")
+            label_col_idx, value_col_idx = get_best_column_indexes(columns)
         else:
             label_col_idx = 0
             value_col_idx = -1  # Last column
@@ -5287,6 +6518,11 @@ def format_data_for_chart_type(data, chart_type, question, columns=None):
         if columns and len(columns) > 0:
             is_dow = is_day_of_week_column(columns[label_col_idx] if label_col_idx < len(columns) else columns[0], question)
         
+        # Column name variants are per result, not per row
+        label_cols = [c.lower().replace('a.', '').replace('b.', '').replace('c.', '') for c in columns or ()]
+        clean_cols = [c.replace('a.', '').replace('b.', '').replace('c.', '') for c in columns or ()]
+        clean_cols_lower = [c.lower() for c in clean_cols]
+        
         for item in data:
             if len(item) >= 2:
                 # Use intelligent column selection for label and value
@@ -5315,12 +6551,6 @@ def format_data_for_chart_type(data, chart_type, question, columns=None):
                     # If the row looks like: [origin, destination, <numeric>], build "origin → destination"
                     if len(item) >= 3:
                         # Check that last field is numeric and first two fields are non-numeric strings
-                        def _is_number(v):
-                            try:
-                                float(str(v))
-                                return True
-                            except Exception:
-                                return False
                         if _is_number(item[-1]) and (not _is_number(item[0])) and (not _is_number(item[1])):
                             label_value = f"{str(item[0])} → {str(item[1])}"
                 except Exception:
@@ -5331,7 +6561,7 @@ def format_data_for_chart_type(data, chart_type, question, columns=None):
                     # Look for country name, city name, or other meaningful identifiers
                     for i, col in enumerate(columns):
                         if i < len(item):
-                            col_lower = col.lower().replace('a.', '').replace('b.', '').replace('c.', '')
+                            col_lower = label_cols[i]
                             # Prefer country names, city names over continents
                             if 'origin_city' in col_lower and len(item) > 1:
                                 # If columns explicitly include origin/destination, compose label
@@ -5352,10 +6582,9 @@ def format_data_for_chart_type(data, chart_type, question, columns=None):
                     added_columns = set(['label', 'value'])
                     for i, val in enumerate(item):
                         if i < len(columns):
-                            col_name = columns[i]
                             # Clean up column names
-                            col_name = col_name.replace('a.', '').replace('b.', '').replace('c.', '')
-                            original_col_name = col_name.lower()
+                            col_name = clean_cols[i]
+                            original_col_name = clean_cols_lower[i]
                             # Skip if this column represents the same data as label or value
                             if (original_col_name in ['region', 'name', 'title'] and str(val) == data_obj['label']):
                                 continue
@@ -5508,8 +6737,7 @@ def ask_question():
                     if conversation_id and not is_new_conversation:
                         # Summarize if too many messages
                         try:
-                            total = get_message_count(conversation_id)
-                            if total > 10:
+                            if message_count_at_least(conversation_id, 11):
                                 oldest = get_oldest_messages(conversation_id, limit=10)
                                 # Build short text to summarize
                                 hist_for_sum = []
@@ -5520,10 +6748,7 @@ def ask_question():
                                         hist_for_sum.append(f"{role}: {content[:600]}")
                                 sum_input = "\n".join(hist_for_sum)
                                 try:
-                                    summarizer = ChatPromptTemplate.from_template(
-                                        """Summarize the following chat turns into 4-6 concise bullet points capturing key facts, user intent, and decisions. Keep numbers if present.\n\n{content}\n\nSummary:"""
-                                    ) | llm | StrOutputParser()
-                                    result = summarizer.invoke({"content": sum_input})
+                                    result = _SUMMARY_CHAIN.invoke({"content": sum_input})
                                     # Ensure result is a string
                                     if not isinstance(result, str):
                                         result = str(result)
@@ -5563,17 +6788,18 @@ def ask_question():
                         register_database(database)
                         schema_info = _SCHEMA_JSON
                         # Pass conversation_id to scope facts properly
-                        exploration = explore_data_for_facts(question=q, database_name=database, conversation_id=conversation_id)
+                        exploration = explore_data_for_facts(question=q, database_name=database, conversation_id=conversation_id, is_casual=False)
                         facts_text = exploration.get('facts', '(no precomputed facts)')
                         allowed_text = exploration.get('allowed', '(none)')
-                        chain = chat_markdown_prompt | llm | StrOutputParser()
+                        chain = _CHAT_MARKDOWN_CHAIN
                         return chain.invoke({
                             "question": q,
                             "database_name": database,
                             "schema": _SCHEMA_JSON,
-                            "samples": safe_json_dumps(sample_database_tables(database), ensure_ascii=False)[:4000],
+                            "samples": get_samples_text(database),
                             "facts": facts_text,
                             "allowed_entities": allowed_text,
+                            "style_examples": select_style_examples(q),
                             "history": h or ""
                         }).strip()
                     except Exception as ie:
@@ -5588,7 +6814,7 @@ def ask_question():
                 
                 # Get facts from exploration for this question (for internal storage)
                 # Pass conversation_id to scope facts to this conversation only
-                exploration = explore_data_for_facts(question=question, database_name=database, conversation_id=conversation_id)
+                exploration = explore_data_for_facts(question=question, database_name=database, conversation_id=conversation_id, is_casual=False)
                 facts_text = exploration.get("facts", "")
                 
                 # Extract and generate charts from markdown
@@ -5707,7 +6933,9 @@ def get_databases():
     try:
         # Inline function to avoid unnecessary wrapper
         available: dict[str, str] = {}
-        for name in databases.keys():
+        with _databases_lock:
+            names = list(databases)
+        for name in names:
             available[name] = f"Configured database '{name}'"
         return jsonify({
             "success": True,
@@ -5736,29 +6964,32 @@ def get_database_schema():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@functools.lru_cache(maxsize=4)
+def _inspect_preview(schema_fingerprint: str) -> dict:
+    """Per-collection column listing, built once per schema version."""
+    # Use hardcoded schema
+    schema_data = get_hardcoded_schema()
+    
+    # Format it similar to old inspect format for compatibility
+    preview = {}
+    for collection in schema_data.get("collections", []):
+        coll_name = collection.get("name", "").lower()
+        fields = collection.get("fields", [])
+        cols = [f.get("name") for f in fields]
+        
+        preview[coll_name] = {
+            "columns": cols,
+            "rows": [],  # No sample data in API mode
+            "primary_key": ["_id"]  # MongoDB default
+        }
+    return preview
+
 @app.route('/api/inspect', methods=['GET'])
 def api_inspect_database():
     """Return database schema information (API-based mode)."""
     try:
         db_name = request.args.get('database') or 'zigment'
-        
-        # Use hardcoded schema
-        schema_data = get_hardcoded_schema()
-        
-        # Format it similar to old inspect format for compatibility
-        preview = {}
-        for collection in schema_data.get("collections", []):
-            coll_name = collection.get("name", "").lower()
-            fields = collection.get("fields", [])
-            cols = [f.get("name") for f in fields]
-            
-            preview[coll_name] = {
-                "columns": cols,
-                "rows": [],  # No sample data in API mode
-                "primary_key": ["_id"]  # MongoDB default
-            }
-        
-        return jsonify({"success": True, "tables": preview})
+        return jsonify({"success": True, "tables": _inspect_preview(_SCHEMA_FINGERPRINT)})
     
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500